@@ -1,16 +1,27 @@
 import streamlit as st
 import os
 import pandas as pd
-from openai import OpenAI
 from dotenv import load_dotenv
-import re
 import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from datetime import datetime
+from record_store import open_record_store
+from conversation_context import build_context_messages
+from prompts import SYSTEM_PROMPT_HASH, build_case_context, build_system_messages, prompt_prefix_stats, record_prompt_usage
+from sop_flow import DECISION, SopState, advance, record_decision, start_case, verified_decision
+from sop_templates import render_decision_summary, render_release_details
+from release_decision import RELEASE_DECISION_TOOL, RELEASE_DECISION_TOOL_CHOICE, parse_release_decision
+from bank_notifications import build_release_email, release_reference, smtp_settings
+from email_outbox import FAILED, PENDING, SENDING, SENT, EmailOutbox, OutboxWorker
+from smtp_pool import BATCH_MODES, SMTPConnectionPool, deliver_batch
+from llm_gateway import LLMDeadlineExceeded, open_llm_backend
+from response_cache import ResponseCache, cache_key, conversation_hash
+from model_routes import GENERAL, build_route_table, route_for
+from input_scanner import InputScanner
+from case_index import is_valid_nric
+from chat_history import RenderCache, history_window, new_message, to_markdown
+from portal_table import MONEY_FORMAT, format_records_table, money_display_columns
+from telemetry import configure_logging, get_logger, record_token_usage, set_metrics_enabled, span, start_metrics_server
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 # Load BANK_EMAIL_MAPPING info from .env 
 bank_emails_str = os.getenv("BANK_EMAILS", "")
@@ -26,6 +37,71 @@ IRAS_CONTACT_PHONE = os.getenv("IRAS_CONTACT_PHONE", "(+65) 6356 7012")
 IRAS_CONTACT_EMAIL = os.getenv("IRAS_CONTACT_EMAIL", "tax_support@iras.gov.sg")
 IRAS_WEBSITE = os.getenv("IRAS_WEBSITE", "www.iras.gov.sg")
 IRAS_OPERATING_HOURS = os.getenv("IRAS_OPERATING_HOURS", "Mondays to Fridays (8 a.m. to 5 p.m.)")
+IRAS_CONTACT = {
+    "phone": IRAS_CONTACT_PHONE,
+    "email": IRAS_CONTACT_EMAIL,
+    "website": IRAS_WEBSITE,
+    "hours": IRAS_OPERATING_HOURS,
+}
+
+# Durable queue for bank release emails, drained by a background worker
+EMAIL_OUTBOX_PATH = os.getenv("EMAIL_OUTBOX_PATH", "data/email_outbox.db")
+# Persistent SMTP sessions shared by the worker, and how queued notices are batched per bank
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "2"))
+EMAIL_BATCH_MODE = os.getenv("EMAIL_BATCH_MODE", "session")
+if EMAIL_BATCH_MODE not in BATCH_MODES:
+    raise ValueError(f"Unknown EMAIL_BATCH_MODE '{EMAIL_BATCH_MODE}'. Expected one of: {', '.join(BATCH_MODES)}")
+
+# Stream model replies into the chat as tokens arrive (set to "false" to wait for the full reply)
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "true").lower() == "true"
+APPROVAL_MARKER = "BANK_APPOINTMENT_RELEASE_APPROVED"
+
+# Conversation context limits: recent turns sent verbatim, and the prompt token budget
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", "6"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+
+# Chat messages drawn per page; older ones are loaded on request
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "20"))
+
+# Chat model backend: openai, openai-compatible (any OpenAI-compatible endpoint at LLM_BASE_URL,
+# e.g. a local llama.cpp/vLLM server or stub_llm.py) or stub (scripted, no network)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+LLM_STUB_SCRIPT = os.getenv("LLM_STUB_SCRIPT") or None
+CHAT_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+# Optional faster/cheaper model for short SOP clarification turns (defaults to LLM_MODEL)
+LLM_FAST_MODEL = os.getenv("LLM_FAST_MODEL") or None
+# Model, temperature and max_tokens per SOP step
+MODEL_ROUTES = build_route_table(CHAT_MODEL, LLM_FAST_MODEL)
+
+# Shared LLM gateway limits: concurrent calls per process, org quota, retries and per-call deadline
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "3500"))
+OPENAI_TOKENS_PER_MINUTE = int(os.getenv("OPENAI_TOKENS_PER_MINUTE", "200000"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+
+# Cache for answers to general IIT questions asked without any personal data (TTL in seconds)
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "500"))
+
+# Tax records source: the CSV, a snapshot directory built with tax_snapshot.py,
+# or a SQLite database built with sqlite_store.py
+TAX_RECORDS_PATH = os.getenv("TAX_RECORDS_PATH", "data/tax_records.csv")
+TAX_RECORDS_BACKEND = os.getenv("TAX_RECORDS_BACKEND") or None
+# Formatted Tax Assessment Records tables kept in memory (one per case and data version)
+PORTAL_TABLE_CACHE_SIZE = int(os.getenv("PORTAL_TABLE_CACHE_SIZE", "256"))
+
+# Logging (LOG_LEVEL, text or json LOG_FORMAT) and per-stage timing metrics, served at /metrics when METRICS_PORT is set
+LOG_LEVEL = os.getenv("LOG_LEVEL", "WARNING")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+METRICS_PORT = int(os.getenv("METRICS_PORT") or 0)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+configure_logging(LOG_LEVEL, LOG_FORMAT)
+set_metrics_enabled(METRICS_ENABLED)
+logger = get_logger("app")
 
 # Page configuration
 st.set_page_config(
@@ -34,6 +110,20 @@ st.set_page_config(
     layout="wide"
 )
 
+# Prometheus-style /metrics endpoint, one per process
+@st.cache_resource
+def get_metrics_server():
+    try:
+        server = start_metrics_server(METRICS_PORT, METRICS_HOST)
+    except OSError as e:
+        logger.error("Metrics endpoint not started on %s:%s: %s", METRICS_HOST, METRICS_PORT, e)
+        return None
+    logger.info("Serving metrics on http://%s:%s/metrics", *server.server_address[:2])
+    return server
+
+if METRICS_ENABLED and METRICS_PORT:
+    get_metrics_server()
+
 # Password Protection
 def check_password():
     """Returns True if the user has entered the correct password."""
@@ -90,14 +180,8 @@ if "case_number" not in st.session_state:
     st.session_state.case_number = ""
 if "input_key" not in st.session_state:
     st.session_state.input_key = 0
-if "bank_appointment_info" not in st.session_state:
-    st.session_state.bank_appointment_info = {
-        "identification": {},
-        "bank_account": {},
-        "payment_evidence": {},
-        "authorisation": {},
-        "multiple_accounts": {}
-    }
+if "sop_state" not in st.session_state:
+    st.session_state.sop_state = SopState()
 if "bank_appointment_release_approved" not in st.session_state:
     st.session_state.bank_appointment_release_approved = False
 if "release_summary" not in st.session_state:
@@ -106,70 +190,70 @@ if "email_sent" not in st.session_state:
     st.session_state.email_sent = False
 if "bank_name" not in st.session_state:
     st.session_state.bank_name = ""
+if "history_shown" not in st.session_state:
+    st.session_state.history_shown = CHAT_HISTORY_WINDOW
+if "render_cache" not in st.session_state:
+    st.session_state.render_cache = RenderCache()
+
+# Cleared at the end of the script, so a fragment can tell whether it is running on its own
+st.session_state.full_app_run = True
+
+# Function to reject mistyped or unknown identifiers locally; returns the reply to show, or None if they are fine
+def identifier_error(nric, case_number):
+    # Answered from the store's own index, so nothing is copied per process or rebuilt on each change
+    store = get_record_store()
+    store.refresh()
+    # Records are authoritative: an NRIC on file is accepted even if its check letter does not verify
+    if nric and not store.has_nric(nric) and not is_valid_nric(nric):
+        return (f"❌ '{nric}' is not a valid NRIC/FIN: the check letter does not match the digits.\n\n"
+                "Please check it for typos and provide it again.")
+    if nric and case_number and (nric, case_number) not in store:
+        return (f"❌ I couldn't find case {case_number} for NRIC {nric}.\n\n"
+                "Please check both your NRIC and Case Number and try again.")
+    return None
 
-# Function to extract NRIC and Case Number
-def extract_nric_case(text):
-    nric_pattern = r'\b[STFG]\d{7}[A-Z]\b'
-    case_pattern = r'\bTX\d{3}\b'
-
-    nric_match = re.search(nric_pattern, text, re.IGNORECASE)
-    case_match = re.search(case_pattern, text, re.IGNORECASE)
-
-    return nric_match.group(0).upper() if nric_match else None, case_match.group(0).upper() if case_match else None
-
-def validate_nric_format(nric):
-    """Validate NRIC format: Must start with S/T/F/G, followed by 7 digits and 1 letter."""
-    if not nric:
-        return False, "NRIC not provided"
-
-    nric_pattern = r'^[STFG]\d{7}[A-Z]$'
-    if not re.match(nric_pattern, nric.upper()):
-        return False, "Invalid NRIC format. Expected format: S/T/F/G followed by 7 digits and 1 letter (e.g., S1234567A)"
-
-    return True, "Valid NRIC format"
-
-def validate_case_number_format(case_number):
-    """Validate Case Number format: Must be TX followed by 3 digits."""
-    if not case_number:
-        return False, "Case Number not provided"
-
-    case_pattern = r'^TX\d{3}$'
-    if not re.match(case_pattern, case_number.upper()):
-        return False, "Invalid Case Number format. Expected format: TX followed by 3 digits (e.g., TX001)"
-
-    return True, "Valid Case Number format"
-
-def check_partial_nric_or_case(text):
-    feedback = []
-
-    potential_nric = re.findall(r'\b[STFG]?\d{1,7}[A-Z]?\b', text, re.IGNORECASE)
-    for match in potential_nric:
-        if match and not re.match(r'^[STFG]\d{7}[A-Z]$', match.upper()):
-            if len(match) > 3:
-                feedback.append(f"⚠️ '{match}' looks like an incomplete NRIC. Format should be: S/T/F/G + 7 digits + 1 letter (e.g., S1234567A)")
+# One precompiled scanner for identifiers, bank names and intent keywords in chat input
+INPUT_SCANNER = InputScanner(BANK_EMAIL_MAPPING.keys())
+
+# Shared LLM backend: one connection pool, concurrency cap and rate limit for every session
+@st.cache_resource
+def get_llm_backend():
+    return open_llm_backend(
+        LLM_BACKEND,
+        base_url=LLM_BASE_URL,
+        api_key=os.getenv("LLM_API_KEY") or os.getenv("OPENAI_API_KEY"),
+        stub_script=LLM_STUB_SCRIPT,
+        max_concurrency=OPENAI_MAX_CONCURRENCY,
+        requests_per_minute=OPENAI_REQUESTS_PER_MINUTE,
+        tokens_per_minute=OPENAI_TOKENS_PER_MINUTE,
+        max_retries=OPENAI_MAX_RETRIES,
+        deadline=OPENAI_TIMEOUT
+    )
 
-    potential_case = re.findall(r'\bTX\d{0,3}\b', text, re.IGNORECASE)
-    for match in potential_case:
-        if match and not re.match(r'^TX\d{3}$', match.upper()):
-            feedback.append(f"⚠️ '{match}' looks like an incomplete Case Number. Format should be: TX + 3 digits (e.g., TX001)")
+# Shared cache of answers to general questions, reused across sessions
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL)
 
-    return feedback
+# Function to check whether this session holds any personal data, in which case replies are never cached
+def session_has_personal_data():
+    return bool(st.session_state.nric or st.session_state.case_number or st.session_state.tax_records is not None)
 
-# Function to extract bank name
-def extract_bank_name(text):
-    text_upper = text.upper()
-    for bank in BANK_EMAIL_MAPPING.keys():
-        if bank in text_upper:
-            return bank
-    return None
+# Shared tax record store, parsed once per process and reused by every session
+@st.cache_resource
+def get_record_store():
+    return open_record_store(TAX_RECORDS_PATH, TAX_RECORDS_BACKEND)
 
 # Function to load tax records
 def load_tax_records(nric, case_number):
     try:
-        df = pd.read_csv("data/tax_records.csv")
-        filtered_df = df[(df['NRIC'] == nric) & (df['Case_Number'] == case_number)]
+        store = get_record_store()
+        with span("record_load"):
+            # Cheap stat() check; only new or changed rows are re-parsed
+            store.refresh()
+            filtered_df = store.get_records(nric, case_number)
 
-        if not filtered_df.empty:
+        if filtered_df is not None:
             columns_to_drop = ['NRIC', 'Case_Number']
             display_df = filtered_df.drop(columns_to_drop, axis=1)
             return display_df
@@ -182,713 +266,479 @@ def load_tax_records(nric, case_number):
         st.error(f"Error loading records: {str(e)}")
         return None
 
-# Function to send bank appointment release email
-def send_bank_release_email(summary, nric, case_number, bank_name=None):
+# Formatted portal tables, keyed by case and store version so changed records are reformatted
+@st.cache_resource(max_entries=PORTAL_TABLE_CACHE_SIZE)
+def get_portal_table(nric, case_number, version):
+    records = get_record_store().get_records(nric, case_number)
+    return None if records is None else format_records_table(records)
+
+# Shared email outbox, with one background worker per process delivering queued release notices
+@st.cache_resource
+def get_email_outbox():
+    outbox = EmailOutbox(EMAIL_OUTBOX_PATH)
+    pool = SMTPConnectionPool(smtp_settings(), size=SMTP_POOL_SIZE)
+    worker = OutboxWorker(
+        outbox,
+        send_batch=lambda emails: deliver_batch(pool, emails, mode=EMAIL_BATCH_MODE),
+        permanent_errors=(smtplib.SMTPAuthenticationError,)
+    )
+    worker.start()
+    return outbox, worker
+
+# Function to queue the bank appointment release email; delivery happens in the background
+def queue_bank_release_email(release_details, nric, case_number, bank_name=None):
+    settings = smtp_settings()
+    logger.debug("Release email: sender=%s password_configured=%s bank=%s",
+                 settings["sender_email"], bool(settings["sender_password"]), bank_name)
+
+    # Determine recipient bank email
+    if bank_name and bank_name in BANK_EMAIL_MAPPING:
+        bank_email = BANK_EMAIL_MAPPING[bank_name]
+        logger.debug("Bank email from mapping: %s", bank_email)
+    else:
+        bank_email = "yumgiraffeyum@gmail.com"
+        logger.info("No email mapped for bank %r, using the default %s", bank_name, bank_email)
+
+    # Validate email configuration
+    if not settings["sender_email"] or not settings["sender_password"]:
+        error_msg = "⚠️ Email configuration not found. Please configure SENDER_EMAIL and SENDER_PASSWORD in .env file."
+        logger.error("Release email not queued: SENDER_EMAIL/SENDER_PASSWORD not configured")
+        st.error(error_msg)
+        return False, None
+
     try:
-        smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-        smtp_port = int(os.getenv("SMTP_PORT", "587"))
-        sender_email = os.getenv("SENDER_EMAIL")
-        sender_password = os.getenv("SENDER_PASSWORD")
-
-        # -----------------------DEBUGGING-----------------------
-        print(f"[EMAIL DEBUG] SMTP Server: {smtp_server}")
-        print(f"[EMAIL DEBUG] SMTP Port: {smtp_port}")
-        print(f"[EMAIL DEBUG] Sender Email: {sender_email}")
-        print(f"[EMAIL DEBUG] Password configured: {'Yes' if sender_password else 'No'}")
-        print(f"[EMAIL DEBUG] Bank Name: {bank_name}")
-
-        # Determine recipient bank email
-        if bank_name and bank_name in BANK_EMAIL_MAPPING:
-            bank_email = BANK_EMAIL_MAPPING[bank_name]
-            print(f"[EMAIL DEBUG] Bank email from mapping: {bank_email}")
+        email = build_release_email(release_details, nric, case_number, bank_name, bank_email, settings["sender_email"], IRAS_CONTACT)
+        outbox, worker = get_email_outbox()
+        if outbox.enqueue(email):
+            logger.info("Queued %s for %s", email["reference"], bank_email)
         else:
-            bank_email = "yumgiraffeyum@gmail.com"
-            print(f"[EMAIL DEBUG] Using default bank email: {bank_email}")
-
-        # Validate email configuration
-        if not sender_email or not sender_password:
-            error_msg = "⚠️ Email configuration not found. Please configure SENDER_EMAIL and SENDER_PASSWORD in .env file."
-            print(f"[EMAIL DEBUG ERROR] {error_msg}")
-            st.error(error_msg)
-            return False, None
-
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = bank_email
-        msg['Subject'] = f"IRAS Bank Appointment Release Notice - {nric} ({case_number})"
-
-        current_date = datetime.now().strftime("%d %B %Y")
-        current_time = datetime.now().strftime("%H:%M:%S")
-
-        # Extract only Bank Appointment Information, Fund Availability, and Verification from summary for email
-        extracted_info = ""
-        if summary:
-            lines = summary.split('\n')
-            capture = False
-            captured_sections = []
-
-            for line in lines:
-                if 'BANK APPOINTMENT INFORMATION' in line.upper():
-                    capture = True
-                    captured_sections.append(line)
-                    continue
-                
-                if capture and ('BANK_APPOINTMENT_RELEASE_APPROVED' in line or
-                               (line.strip() and not line.strip().startswith('-') and
-                                'IRAS will send' in line)):
-                    break
-
-                # Capture lines between the sections we want
-                if capture:
-                    captured_sections.append(line)
-
-            extracted_info = '\n'.join(captured_sections).strip()
-
-        email_body = f"""Dear Bank Officer,
-
-This email serves as an official notification from the Inland Revenue Authority of Singapore (IRAS) regarding a Bank Appointment Release for the taxpayer listed below.
-
-DOCUMENT INFORMATION
-------------------------------------------------------------
-Reference Number: IRAS-BankAppt-{case_number}
-Date of Issue   : {current_date}
-Time of Issue   : {current_time}
-Issued By       : Inland Revenue Authority of Singapore (IRAS)
-
-CASE SUMMARY
-------------------------------------------------------------
-The following verified information has been extracted from the case:
-
-{extracted_info}
-
-AUTHORISATION
-------------------------------------------------------------
-IRAS authorises {bank_name if bank_name else "the bank"} to proceed with the release of the affected bank account(s). All relevant checks have been completed, including identity verification and liability clearance.
-
-Verification Status:
-• Taxpayer identity confirmed
-• Tax liabilities fully settled
-• Bank account details validated
-• Release conditions met
-
-ACTION REQUIRED
-------------------------------------------------------------
-Please carry out the following steps:
-1. Process the bank appointment release as soon as possible
-2. Restore all affected account(s) to normal operation
-3. Notify the account holder upon completion
-4. Send release confirmation to IRAS
-
-CONTACT INFORMATION
-------------------------------------------------------------
-For queries or verification, you may contact IRAS at:
-• Phone          : {IRAS_CONTACT_PHONE}
-• Email          : {IRAS_CONTACT_EMAIL}
-• Website        : {IRAS_WEBSITE}
-• Operating Hours: {IRAS_OPERATING_HOURS}
-
-NOTES
-------------------------------------------------------------
-• This email constitutes an official communication from IRAS.
-• You may verify the authenticity of this notice if required.
-• Please retain this email for your internal records.
-
-Thank you for your prompt attention to this matter.
-
-Yours sincerely,
-Inland Revenue Authority of Singapore (IRAS)
-
-============================================================
-Automated System Notification
-Generated by the IRAS Tax Buddy System
-Timestamp: {current_date}, {current_time}
-Reference: IRAS-BankAppt-{case_number}
-============================================================
-
-CONFIDENTIALITY NOTICE: This email and its contents are confidential and intended solely for the recipient. If you are not the intended recipient, please delete this email immediately and notify the sender.
-"""
-
-        msg.attach(MIMEText(email_body, 'plain'))
-
-        print(f"[EMAIL DEBUG] Attempting to send email...")
-        print(f"[EMAIL DEBUG] From: {sender_email}")
-        print(f"[EMAIL DEBUG] To: {bank_email}")
-        print(f"[EMAIL DEBUG] Subject: {msg['Subject']}")
-
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            print(f"[EMAIL DEBUG] Connected to SMTP server")
-            server.starttls()
-            print(f"[EMAIL DEBUG] TLS started")
-            server.login(sender_email, sender_password)
-            print(f"[EMAIL DEBUG] Login successful")
-            server.send_message(msg)
-            print(f"[EMAIL DEBUG] Email sent successfully!")
-
-        print(f"[EMAIL DEBUG] ✓ Email sent to {bank_email}")
+            logger.info("%s already queued or sent, not queuing again", email["reference"])
+        worker.wake()
         return True, bank_email
 
-    except smtplib.SMTPAuthenticationError as e:
-        error_msg = f"""❌ SMTP Authentication failed.
-        
-        If you're using Gmail, you need to use an App Password (not your regular password).
-        Steps to fix:
-            1. Go to https://myaccount.google.com/apppasswords
-            2. Enable 2-Step Verification if not already enabled
-            3. Generate an App Password for 'AI_Bootcamp'
-            4. Update SENDER_PASSWORD in your .env file with the App Password
-
-        Error details: {str(e)}"""
-        print(f"[EMAIL DEBUG ERROR] {error_msg}")
-        st.error(error_msg)
-        return False, None
-    
-    except smtplib.SMTPException as e:
-        error_msg = f"❌ SMTP error occurred: {str(e)}"
-        print(f"[EMAIL DEBUG ERROR] {error_msg}")
-        st.error(error_msg)
-        return False, None
-    
     except Exception as e:
-        error_msg = f"❌ Failed to send email notification: {str(e)}"
-        print(f"[EMAIL DEBUG ERROR] {error_msg}")
+        error_msg = f"❌ Failed to queue email notification: {str(e)}"
+        logger.exception("Failed to queue the release email")
         st.error(error_msg)
         return False, None
 
-# Display chat history in a scrollable container with fixed height
-with st.container(height=400, border=True):
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
-
-with st.form(key=f"chat_form_{st.session_state.input_key}", clear_on_submit=True):
-    input_col1, input_col2 = st.columns([0.92, 0.08])
-
-    with input_col1:
-        user_input = st.text_input("Your message:", placeholder="What would you like to know?", label_visibility="collapsed", key=f"chat_input_{st.session_state.input_key}")
-
-    with input_col2:
-        send_button = st.form_submit_button("▶", use_container_width=True)
-
-if send_button and user_input:
-    extracted_nric, extracted_case = extract_nric_case(user_input)
-
-    # Check if user already has valid NRIC and Case Number in session
-    # If yes, skip all validation as they're in the conversation flow
-    already_authenticated = st.session_state.nric and st.session_state.case_number
-
-    # Check if user is trying to provide NRIC or Case Number based on keywords
-    user_input_lower = user_input.lower()
-    mentions_nric = any(keyword in user_input_lower for keyword in ['nric', 'ic number', 'identification'])
-    mentions_case = any(keyword in user_input_lower for keyword in ['case number', 'case no', 'case id', 'tx'])
-
-    # Check if user is providing bank account information
-    mentions_bank_account = any(keyword in user_input_lower for keyword in ['account', 'last 4 digits', 'last four', 'bank account', 'account number'])
-
-    # If user mentions NRIC but no valid NRIC was extracted, check for invalid formats
-    # Skip validation if user is already authenticated, in conversation flow
-    if mentions_nric and not extracted_nric and not already_authenticated:
-        has_numbers = bool(re.search(r'\d+', user_input))
-        if has_numbers:
-            st.session_state.messages.append({"role": "user", "content": user_input})
-            st.session_state.messages.append({"role": "assistant", "content":
-                "❌ I detected you mentioned 'NRIC' but the format appears to be incorrect.\n\n"
-                "**Valid NRIC format:** Must start with S, T, F, or G, followed by exactly 7 digits and 1 letter.\n"
-                "**Example:** S1234567A\n\n"
-                "Please provide your NRIC in the correct format."})
-            st.session_state.input_key += 1
-            st.rerun()
-
-    # If user mentions case number but no valid case number was extracted, skip validation if user is already authenticated
-    if mentions_case and not extracted_case and not extracted_nric and not already_authenticated:
-        has_numbers = bool(re.search(r'\d+', user_input))
-        if has_numbers:
-            st.session_state.messages.append({"role": "user", "content": user_input})
-            st.session_state.messages.append({"role": "assistant", "content":
-                "❌ I detected you mentioned 'case number' but the format appears to be incorrect.\n\n"
-                "**Valid Case Number format:** Must be TX followed by exactly 3 digits.\n"
-                "**Example:** TX001\n\n"
-                "Please provide your Case Number in the correct format."})
-            st.session_state.input_key += 1
-            st.rerun()
-
-    # Validate extracted NRIC if found
-    if extracted_nric:
-        is_valid, message = validate_nric_format(extracted_nric)
-        if is_valid:
-            st.session_state.nric = extracted_nric
-        else:
-            st.session_state.messages.append({"role": "user", "content": user_input})
-            st.session_state.messages.append({"role": "assistant", "content": f"❌ {message}\n\nPlease provide a valid NRIC in the format: S/T/F/G followed by 7 digits and 1 letter (e.g., S1234567A)"})
-            st.session_state.input_key += 1
-            st.rerun()
-
-    # Validate extracted Case Number if found
-    if extracted_case:
-        is_valid, message = validate_case_number_format(extracted_case)
-        if is_valid:
-            st.session_state.case_number = extracted_case
-        else:
-            st.session_state.messages.append({"role": "user", "content": user_input})
-            st.session_state.messages.append({"role": "assistant", "content": f"❌ {message}\n\nPlease provide a valid Case Number in the format: TX followed by 3 digits (e.g., TX001)"})
-            st.session_state.input_key += 1
-            st.rerun()
-
-    # Check for partial/invalid patterns only if no keywords were mentioned AND not bank account context
-    # Skip validation if user is already authenticated (in conversation flow)
-    validation_feedback = check_partial_nric_or_case(user_input)
-    if validation_feedback and not extracted_nric and not extracted_case and not mentions_nric and not mentions_case and not mentions_bank_account and not already_authenticated:
-        feedback_message = "\n\n".join(validation_feedback)
-        st.session_state.messages.append({"role": "user", "content": user_input})
-        st.session_state.messages.append({"role": "assistant", "content": feedback_message})
-        st.session_state.input_key += 1
-        st.rerun()
-
-    if st.session_state.nric and st.session_state.case_number:
-        st.session_state.tax_records = load_tax_records(st.session_state.nric, st.session_state.case_number)
-
-    extracted_bank = extract_bank_name(user_input)
-    if extracted_bank:
-        st.session_state.bank_name = extracted_bank
-
-    st.session_state.messages.append({"role": "user", "content": user_input})
-    
-    # Load SOP content for bank appointment release process
-    try:
-        sop_content = ""
-        try:
-            with open("SOP.txt", "r") as f:
-                sop_content = f.read()
-        except:
-            pass
-
-        system_message = """You are IRAS Tax Buddy, a helpful assistant for Individual Income Tax (IIT) matters in Singapore.
-        You only handle IIT bank appointment cases. Taxpayers are transferred to you after IVR triaging.
+# Function to hide the approval marker from partially streamed text
+def visible_stream_text(text):
+    """Strip the approval marker, holding back a trailing partial marker until more tokens arrive."""
+    text = text.replace(APPROVAL_MARKER, "")
+    for i in range(len(APPROVAL_MARKER) - 1, 0, -1):
+        if text.endswith(APPROVAL_MARKER[:i]):
+            return text[:-i]
+    return text
+
+# Function to render a streamed chat completion as it arrives; returns the full text and token usage
+def stream_response(stream, placeholder):
+    full_response = ""
+    usage = None
+    for chunk in stream:
+        if getattr(chunk, "usage", None) is not None:
+            usage = chunk.usage
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            full_response += delta
+            placeholder.markdown(to_markdown(visible_stream_text(full_response)) + "▌")
+    placeholder.markdown(to_markdown(visible_stream_text(full_response)))
+    return full_response, usage
+
+# Function to run the SOP state machine for this turn; returns None when no case is in progress
+def sop_turn_action(user_input, extracted_nric, extracted_case):
+    nric, case_number = st.session_state.nric, st.session_state.case_number
+    if not (nric and case_number):
+        return None
+    summary = get_record_store().get_summary(nric, case_number)
+    if summary is None:
+        return None
 
-        You can help users with:
-            - General IIT questions
-            - Understanding tax assessments and payments
-            - Tax filing guidance
-            - IIT Bank Appointment Release Process
+    # A newly identified case starts the flow with the Step 1 disclosure
+    if (extracted_nric or extracted_case) and not st.session_state.sop_state.is_case(nric, case_number):
+        st.session_state.sop_state, action = start_case(nric, case_number, summary)
+        return action
 
-        If users mention their NRIC or Case Number, acknowledge naturally and inform them their details will be auto-filled in MyTax Portal.
-        Also verify that their enquiry relates to Individual Income Tax (IIT).
-        
-        === BANK APPOINTMENT RELEASE PROCESS (IIT ONLY) ===
+    if not st.session_state.sop_state.is_case(nric, case_number):
+        return None
+    return advance(st.session_state.sop_state, user_input, summary, BANK_EMAIL_MAPPING.keys())
+
+# Function to add a chat message; its ID keys the rendered markdown cache
+def add_message(role, content):
+    st.session_state.messages.append(new_message(role, content))
+
+# Function to page older chat messages into the history window
+def show_earlier_messages():
+    st.session_state.history_shown += CHAT_HISTORY_WINDOW
+
+# What the portal shows; a chat turn that changes it reruns the whole app so the portal refreshes
+def portal_state():
+    return (
+        st.session_state.nric,
+        st.session_state.case_number,
+        st.session_state.bank_appointment_release_approved,
+        st.session_state.email_sent,
+    )
 
-        STEP 1: TAXPAYER VERIFICATION AND INFORMATION DISCLOSURE
-        ---------------------------------------------------------
-        When a user provides their NRIC and case number, or requests bank appointment release:
+# Function to end a chat turn: clear the input and rerun only the chat fragment, or the whole app if the portal changed
+def finish_turn(portal_before):
+    st.session_state.input_key += 1
+    # A fragment-scoped rerun is only allowed while the fragment is running on its own
+    if not st.session_state.full_app_run and portal_state() == portal_before:
+        st.rerun(scope="fragment")
+    st.rerun()
 
-        A. Identity Verification:
-            - The system automatically extracts and verifies NRIC and case number
-            - Acknowledge receipt: "Hello! Thank you for providing your NRIC and case number."
+# Chat area as a fragment: a chat turn reruns only this function, not the login gate, portal and sidebar
+@st.fragment
+def chat_section():
+    # Display chat history in a scrollable container with fixed height
+    # Only the latest window of messages is drawn; older pages are loaded on request
+    chat_container = st.container(height=400, border=True)
+    with chat_container:
+        hidden, window = history_window(st.session_state.messages, st.session_state.history_shown)
+        if hidden:
+            st.button(f"Show {min(hidden, CHAT_HISTORY_WINDOW)} earlier messages", key="show_earlier_messages", on_click=show_earlier_messages)
+        render_cache = st.session_state.render_cache
+        for message in window:
+            with st.chat_message(message["role"]):
+                st.markdown(render_cache.markdown(message))
+
+    with st.form(key=f"chat_form_{st.session_state.input_key}", clear_on_submit=True):
+        input_col1, input_col2 = st.columns([0.92, 0.08])
+
+        with input_col1:
+            user_input = st.text_input("Your message:", placeholder="What would you like to know?", label_visibility="collapsed", key=f"chat_input_{st.session_state.input_key}")
+
+        with input_col2:
+            send_button = st.form_submit_button("▶", use_container_width=True)
+
+    if send_button and user_input:
+        portal_before = portal_state()
+
+        # NRIC, case number, bank, partial identifiers and intent keywords in a single pass
+        with span("input_scan"):
+            scan = INPUT_SCANNER.scan(user_input)
+        extracted_nric, extracted_case = scan.nric, scan.case_number
+
+        # Check if user already has valid NRIC and Case Number in session
+        # If yes, skip all validation as they're in the conversation flow
+        already_authenticated = st.session_state.nric and st.session_state.case_number
+
+        # If user mentions NRIC but no valid NRIC was extracted, check for invalid formats
+        # Skip validation if user is already authenticated, in conversation flow
+        if scan.mentions_nric and not extracted_nric and not already_authenticated:
+            if scan.has_digits:
+                add_message("user", user_input)
+                add_message("assistant", "❌ I detected you mentioned 'NRIC' but the format appears to be incorrect.\n\n"
+                    "**Valid NRIC format:** Must start with S, T, F, G, or M, followed by exactly 7 digits and 1 letter.\n"
+                    "**Example:** S1234567A\n\n"
+                    "Please provide your NRIC in the correct format.")
+                finish_turn(portal_before)
+
+        # If user mentions case number but no valid case number was extracted, skip validation if user is already authenticated
+        if scan.mentions_case and not extracted_case and not extracted_nric and not already_authenticated:
+            if scan.has_digits:
+                add_message("user", user_input)
+                add_message("assistant", "❌ I detected you mentioned 'case number' but the format appears to be incorrect.\n\n"
+                    "**Valid Case Number format:** Must be TX followed by exactly 3 digits.\n"
+                    "**Example:** TX001\n\n"
+                    "Please provide your Case Number in the correct format.")
+                finish_turn(portal_before)
+
+        # Check the check letter and that the case exists before anything is loaded or sent to the model
+        if extracted_nric or extracted_case:
+            candidate_nric = extracted_nric or st.session_state.nric
+            # A case number given before any NRIC is kept once the NRIC arrives
+            same_nric = not extracted_nric or not st.session_state.nric or extracted_nric == st.session_state.nric
+            candidate_case = extracted_case or (st.session_state.case_number if same_nric else "")
+            error_message = identifier_error(candidate_nric, candidate_case)
+            if error_message:
+                add_message("user", user_input)
+                add_message("assistant", error_message)
+                finish_turn(portal_before)
+            st.session_state.nric = candidate_nric
+            st.session_state.case_number = candidate_case
+
+        # Check for partial/invalid patterns only if no keywords were mentioned AND not bank account context
+        # Skip validation if user is already authenticated (in conversation flow)
+        validation_feedback = scan.feedback
+        if validation_feedback and not extracted_nric and not extracted_case and not scan.mentions_nric and not scan.mentions_case and not scan.mentions_bank_account and not already_authenticated:
+            feedback_message = "\n\n".join(validation_feedback)
+            add_message("user", user_input)
+            add_message("assistant", feedback_message)
+            finish_turn(portal_before)
+
+        if st.session_state.nric and st.session_state.case_number:
+            st.session_state.tax_records = load_tax_records(st.session_state.nric, st.session_state.case_number)
+
+        if scan.bank:
+            st.session_state.bank_name = scan.bank
+
+        add_message("user", user_input)
+
+        # Let the SOP state machine resolve the turn locally; only unresolved turns and the decision reach the model
+        sop_action = sop_turn_action(user_input, extracted_nric, extracted_case)
+        if sop_action and sop_action.reply:
+            add_message("assistant", sop_action.reply)
+            finish_turn(portal_before)
+        step_instruction = sop_action.instruction if sop_action else None
+
+        # Small, fast settings for clarifications and the structured decision; more room for general questions
+        route_step = st.session_state.sop_state.step if step_instruction else GENERAL
+        route = route_for(MODEL_ROUTES, route_step)
+        logger.debug("Model route: %s", route)
+
+        # General questions without personal data are answered from the shared cache when possible
+        faq_key = None
+        if not sop_action and not session_has_personal_data():
+            # The earlier turns shape the reply, so they are part of the key (the new user message is the last one)
+            faq_key = cache_key(user_input, SYSTEM_PROMPT_HASH, route.model, conversation_hash(st.session_state.messages[:-1]))
+        cached_response = get_response_cache().get(faq_key)
+        logger.debug("Response cache: %s", get_response_cache().stats())
+        if cached_response:
+            add_message("assistant", cached_response)
+            finish_turn(portal_before)
 
-        B. Mandatory Information Disclosure (CRITICAL - DO THIS IMMEDIATELY):
-            If the system context shows “CURRENT TAX RECORDS FOR USER”, you must IMMEDIATELY disclose their tax and bank appointment details in this same first response.
+        try:
+            with span("prompt_build"):
+                case_context = None
+                if st.session_state.tax_records is not None and not st.session_state.tax_records.empty:
+                    try:
+                        summary = get_record_store().get_summary(st.session_state.nric, st.session_state.case_number)
+                        if summary is not None:
+                            case_context = build_case_context(summary, st.session_state.nric, st.session_state.case_number)
+                    except:
+                        case_context = f"The user has loaded their tax records for NRIC {st.session_state.nric} (Case {st.session_state.case_number}). You can reference their tax information if relevant to their questions."
+
+                # Recent turns verbatim, older turns folded into a summary of the collected SOP facts
+                messages = build_context_messages(
+                    build_system_messages(case_context, step_instruction),
+                    st.session_state.messages,
+                    st.session_state.sop_state.facts,
+                    max_turns=CONTEXT_MAX_TURNS,
+                    token_budget=CONTEXT_TOKEN_BUDGET,
+                    nric=st.session_state.nric,
+                    case_number=st.session_state.case_number,
+                    model=route.model
+                )
 
-        B1. Check if BANK APPOINTMENT DETAILS exist in the system context
+            # The decision turn is a forced tool call; the summary and bank notice are rendered from its typed fields
+            if st.session_state.sop_state.step == DECISION:
+                with span("llm_call", model=route.model, step=DECISION):
+                    response = get_llm_backend().create(
+                        model=route.model,
+                        messages=messages,
+                        temperature=route.temperature,
+                        max_tokens=route.max_tokens,
+                        tools=[RELEASE_DECISION_TOOL],
+                        tool_choice=RELEASE_DECISION_TOOL_CHOICE
+                    )
+                record_prompt_usage(response.usage)
+                record_token_usage(route.model, response.usage)
+                decision = parse_release_decision(response)
+                logger.info("Structured decision for %s: %s", st.session_state.case_number, decision)
+
+                if decision is None:
+                    full_response = "I'm sorry, I couldn't complete the release determination just now. Please reply 'continue' to try again."
+                else:
+                    # The outcome and every rendered field come from the locally verified SOP facts, not the tool call
+                    summary = get_record_store().get_summary(st.session_state.nric, st.session_state.case_number)
+                    verified = verified_decision(st.session_state.sop_state, summary, decision)
+                    if verified.decision != decision.decision:
+                        logger.warning("Model decided %s for %s but the verified facts give %s; using %s",
+                                       decision.decision, st.session_state.case_number, verified.decision, verified.decision)
+                    decision = verified
+                    full_response = render_decision_summary(decision, summary, st.session_state.nric, st.session_state.case_number)
+                    record_decision(st.session_state.sop_state, decision)
+                    if decision.bank_confirmed:
+                        st.session_state.bank_name = decision.bank_confirmed
+
+                    if decision.approved:
+                        st.session_state.bank_appointment_release_approved = True
+                        st.session_state.release_summary = full_response
+
+                        # Send email to bank
+                        if not st.session_state.email_sent:
+                            email_sent, bank_email = queue_bank_release_email(
+                                render_release_details(decision, summary),
+                                st.session_state.nric,
+                                st.session_state.case_number,
+                                st.session_state.bank_name
+                            )
+                            if email_sent:
+                                st.session_state.email_sent = True
+                                bank_display = f"{st.session_state.bank_name} ({bank_email})" if st.session_state.bank_name else bank_email
+                                st.success(f"✉️ Bank appointment release notice queued for {bank_display}")
+                        else:
+                            logger.debug("Release email already sent for %s", st.session_state.case_number)
+
+            # Call OpenAI API
+            elif STREAM_RESPONSES:
+                # Timed until the last chunk has been rendered, not just until the first byte
+                with span("llm_call", model=route.model, step=route_step, stream=True):
+                    stream = get_llm_backend().create(
+                        model=route.model,
+                        messages=messages,
+                        temperature=route.temperature,
+                        max_tokens=route.max_tokens,
+                        stream=True,
+                        stream_options={"include_usage": True}
+                    )
+
+                    # Render the new turn straight into the chat container; the rerun below redraws it from history
+                    with chat_container:
+                        with st.chat_message("user"):
+                            st.markdown(user_input)
+                        with st.chat_message("assistant"):
+                            full_response, usage = stream_response(stream, st.empty())
+                record_prompt_usage(usage)
+                record_token_usage(route.model, usage)
+            else:
+                with span("llm_call", model=route.model, step=route_step):
+                    response = get_llm_backend().create(
+                        model=route.model,
+                        messages=messages,
+                        temperature=route.temperature,
+                        max_tokens=route.max_tokens
+                    )
 
-            If BANK APPOINTMENT DETAILS shows "NO ACTIVE BANK APPOINTMENT":
-                You MUST immediately inform the user with this response:
-                "Hello! Thank you for providing your NRIC and case number. I've retrieved your tax information.
+                full_response = response.choices[0].message.content
+                record_prompt_usage(response.usage)
+                record_token_usage(route.model, response.usage)
 
-                I can see that you currently have no active bank appointment on your account. Therefore, the bank appointment release process cannot proceed.
+            logger.debug("Prompt prefix: %s", prompt_prefix_stats())
 
-                However, I can still assist you with other Individual Income Tax (IIT) enquiries. How may I help you?"
+            # Approval only ever comes from the structured decision; never show a stray marker from free text
+            full_response = full_response.replace(APPROVAL_MARKER, "").strip()
 
-                Then STOP - do not proceed with the bank appointment release process.
+            if faq_key and not session_has_personal_data():
+                get_response_cache().put(faq_key, full_response)
 
-            If BANK APPOINTMENT DETAILS exist (has Appointed Bank, Amount, Date):
-                Continue with disclosure in B2 below.
+        except LLMDeadlineExceeded:
+            full_response = "⚠️ The assistant is taking too long to respond. Please try again in a moment."
+        except Exception as e:
+            error_message = f"Error: {str(e)}"
+            if "api_key" in str(e).lower():
+                error_message = "⚠️ OpenAI API key not found or invalid. Please check your .env file."
+            full_response = error_message
 
-        B2. Required Immediate Disclosure when Bank Appointment EXISTS (must use actual data provided):
-            You must provide ALL details in your response. Follow this example format EXACTLY, replacing the values with the actual data from the tax records:
+        add_message("assistant", full_response)
 
-            Example format (use actual values from CURRENT TAX RECORDS FOR USER section):
-            "Hello! Thank you for providing your NRIC and case number. I've retrieved your tax information.
-            I can see you have a bank appointment with DBS for S$750.00 made on 25 Mar 2025 for YA 2025.
-            Your total tax liability for YA 2025 is S$1250.00, and your current outstanding balance is S$0.00.
+        # Show the new messages and clear the input
+        finish_turn(portal_before)
 
-            Would you like to proceed with the bank appointment release process?"
+chat_section()
 
-            IMPORTANT: Replace DBS, S$750.00, 25 Mar 2025, etc. with the ACTUAL values from the tax records provided to you. Do NOT use placeholders or brackets.
-            
-        
-        STEP 2: FUND AVAILABILITY ASSESSMENT
-        -------------------------------------
-        CRITICAL - You MUST ask this question, using the ACTUAL values from the BANK APPOINTMENT DETAILS.
-
-        Follow this example format EXACTLY (replace with actual values):
-        "Do you currently have the full appointment amount of S$750.00 available in your DBS account?"
-
-        IMPORTANT: Replace S$750.00 and DBS with the actual Appointment Amount and Appointed Bank from the tax records. Do NOT use placeholders or brackets.
-
-        If user says NO:
-            - Reject the request immediately, with the following statement:
-                "We are unable to proceed with the bank appointment release as the full appointment amount is not available in your account.
-                To explore alternative payment arrangements, please provide your contact number or email. An IRAS officer will contact you within three working days."
-                
-            - Do NOT proceed further.
-            - Do NOT use BANK_APPOINTMENT_RELEASE_APPROVED.
-
-        If user says YES:
-            - Proceed to Step 3.
-            
+# My Tax Portal as a fragment; it is redrawn by full-app reruns when the case state changes, or on its own
+@st.fragment
+def portal_section():
+    st.markdown("---")
+    st.markdown("""
+        <div style="background-color: #2D7BB9; padding: 20px; border-radius: 10px; margin-top: 10px;">
+            <h2 style="color: white; margin-top: 0;">My Tax Portal</h2>
+        </div>
+        """, unsafe_allow_html=True)
 
-        STEP 3: BANK ACCOUNT CONFIRMATION
-        ----------------------------------
-        Ask the below questions sequentially, one question at a time:
-
-            - “Please confirm the bank account that contains the full funds. Which bank is this account with?”
-            - If the bank name does not match the appointed bank, ask for clarification.
-            - Ask for last 4 digits of the account number for verification.
-
-
-        STEP 4: RELEASE DETERMINATION AND SUMMARY GENERATION
-        -----------------------------------------------------
-        Once all info is collected, determine APPROVED or REJECTED.
-
-        Approval Conditions (ALL must be met):
-            - Tax liability is fully settled OR full payment is confirmed
-            - User confirms full appointment amount is available
-            - Bank matches appointed bank
-            - All required information has been provided
-
-        If APPROVED:
-            - Generate the summary (format below)
-            - CRITICAL: You MUST include the exact text "BANK_APPOINTMENT_RELEASE_APPROVED" somewhere in your response (the system will detect this keyword and trigger the email notification)
-            - Inform user IRAS will notify the bank and account will be released
-
-        If REJECTED:
-            - Generate summary explaining what is missing
-            - Do NOT include "BANK_APPOINTMENT_RELEASE_APPROVED" in your response
-        
-        
-        SUMMARY FORMAT (MANDATORY):
-            Always produce this structured summary upon decision:
-
-            "Thank you for your cooperation.
-            Your request for bank appointment release is [APPROVED/REJECTED]
-            REASON: [Explanation]
-
-            Let me provide a summary of this case:
-
-            CASE DETAILS:
-            - NRIC: [NRIC]
-            - Case Number: [Case Number]
-            - Year of Assessment: [YA]
-
-            BANK APPOINTMENT INFORMATION:
-            - Appointed Bank: [Bank Name]
-            - Appointment Amount: S$[Amount]
-            - Appointment Date: [Date]
-
-            TAX LIABILITY STATUS:
-            - Total Payable: S$[Amount]
-            - Total Paid: S$[Amount]
-            - Current Balance: S$[Amount]
-
-            FUND AVAILABILITY:
-            - User confirmed: [YES/NO]
-
-            VERIFICATION:
-            - Bank Account Confirmed: [Bank Name]
-            - Account Details: [Last 4 digits]
-
-            [If APPROVED, add this exact line:]
-            BANK_APPOINTMENT_RELEASE_APPROVED
-
-            [Then add next steps for approved case:]
-            IRAS will send an official notification to [Bank Name] to release the bank appointment. You will be notified once the process is complete.
-
-            [If REJECTED, do NOT add the BANK_APPOINTMENT_RELEASE_APPROVED line. Instead, explain what is missing and what the user needs to do next]"
-
-        
-        CONVERSATIONAL STYLE REQUIREMENTS:
-            - Ask one question at a time
-            - Do not list multiple questions in one message
-            - Keep tone professional and friendly
-            - Acknowledge each user response before proceeding
-            - Track what has been provided; do not repeat questions unnecessarily
-            
-        REJECTION SCENARIOS: 
-            - Reject (with summary) if:
-            - Insufficient funds
-            - Missing required information
-            - Cannot load tax records
-            - Bank mismatch
-            - Outstanding tax balance with no payment confirmation
-        """
-
-        if st.session_state.tax_records is not None and not st.session_state.tax_records.empty:
-            bank_appt_info = ""
+    # Timed from the record fetch to the table, on every rerun
+    with span("portal_render"):
+        # Formatted once per case and data version; a rerun with unchanged records is a cache hit, not a reload
+        display_df = None
+        if st.session_state.nric and st.session_state.case_number:
+            store = get_record_store()
+            store.refresh()
+            display_df = get_portal_table(st.session_state.nric, st.session_state.case_number, store.version)
+
+        # Display NRIC and Case Number
+        if st.session_state.nric and st.session_state.case_number:
+            bank_appointment_date = None
+            appointed_bank = None
+            appointment_amount = None
+
+            # Load bank appointment details from the precomputed case summary for display
             try:
-                df = pd.read_csv("data/tax_records.csv")
-                filtered_df = df[(df['NRIC'] == st.session_state.nric) & (df['Case_Number'] == st.session_state.case_number)]
-                if not filtered_df.empty:
-                    # Get appointment details
-                    appointments = filtered_df[filtered_df['Bank_Appointment_Date'].notna() & (filtered_df['Bank_Appointment_Date'] != '')]
-                    if not appointments.empty:
-                        appt_row = appointments.iloc[-1]
-                        appt_bank = appt_row['Appointed_Bank'] if pd.notna(appt_row.get('Appointed_Bank')) else 'N/A'
-                        appt_amount = f"S${appt_row['Appointment_Amount']:.2f}" if pd.notna(appt_row.get('Appointment_Amount')) else 'N/A'
-
-                        bank_appt_info = f"""
-                        BANK APPOINTMENT DETAILS:
-                        - Appointed Bank: {appt_bank}
-                        - Appointment Amount: {appt_amount}
-                        - Appointment Date: {appt_row['Bank_Appointment_Date']}
-                        - Year of Assessment: {appt_row['Year_of_Assessment']}
-                        """
-                    else:
-                        bank_appt_info = """
-                        BANK APPOINTMENT DETAILS:
-                        - Status: NO ACTIVE BANK APPOINTMENT
-
-                        IMPORTANT: Inform the user that there is no active bank appointment on their account. The bank appointment release process cannot proceed.
-                        """
-
-                    # Get tax liability summary
-                    total_payable = filtered_df['Payable'].sum()
-                    total_paid = filtered_df['Paid'].sum()
-                    current_balance = filtered_df['Balance'].iloc[-1]
-
-                    tax_summary = f"""
-                    ===================================================================
-                    CURRENT TAX RECORDS FOR USER (NRIC: {st.session_state.nric}, Case: {st.session_state.case_number}):
-
-                    TAX LIABILITY SUMMARY:
-                    - Total Payable: S${total_payable:.2f}
-                    - Total Paid: S${total_paid:.2f}
-                    - Current Balance: S${current_balance:.2f}
-                    {bank_appt_info}
-
-                    IMPORTANT INSTRUCTIONS:
-                    - Use exact values when disclosing information to the user
-                    - If BANK APPOINTMENT DETAILS shows "NO ACTIVE BANK APPOINTMENT", inform the user immediately that there is no bank appointment on their account and the release process cannot proceed
-                    - If there IS a bank appointment, when stating "I can see you have a bank appointment with...", use the values from BANK APPOINTMENT DETAILS above
-                    - When stating "Your total tax liability...", use the Total Payable value from TAX LIABILITY SUMMARY above
-                    - When asking about fund availability, use the Appointment Amount from BANK APPOINTMENT DETAILS above
-                    - Use the actual data provided above, not the placeholders like [Amount] or [Bank Name]
-                    ===================================================================
-                    """
-                    system_message += tax_summary
-            except:
-                tax_summary = f"\n\nThe user has loaded their tax records for NRIC {st.session_state.nric} (Case {st.session_state.case_number}). You can reference their tax information if relevant to their questions."
-                system_message += tax_summary
-
-        messages = [{"role": "system", "content": system_message}]
-        messages.extend([
-            {"role": m["role"], "content": m["content"]}
-            for m in st.session_state.messages
-        ])
-
-        # Call OpenAI API
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=1000
-        )
-
-        full_response = response.choices[0].message.content
-
-        # -----------------------DEBUGGING-----------------------
-        print(f"[APPROVAL DEBUG] Checking AI response for approval keyword...")
-        print(f"[APPROVAL DEBUG] Response contains 'BANK_APPOINTMENT_RELEASE_APPROVED': {'BANK_APPOINTMENT_RELEASE_APPROVED' in full_response}")
-
-        # Check if AI approves the bank appointment release
-        if "BANK_APPOINTMENT_RELEASE_APPROVED" in full_response:
-            print(f"[APPROVAL DEBUG] ✓ Approval keyword detected!")
-            st.session_state.bank_appointment_release_approved = True
-
-            # Store the summary for email
-            st.session_state.release_summary = full_response.replace("BANK_APPOINTMENT_RELEASE_APPROVED", "").strip()
-            full_response = full_response.replace("BANK_APPOINTMENT_RELEASE_APPROVED", "").strip()
-            
-            # -----------------------DEBUGGING-----------------------
-            print(f"[APPROVAL DEBUG] Email sent status: {st.session_state.email_sent}")
-            print(f"[APPROVAL DEBUG] NRIC: {st.session_state.nric}")
-            print(f"[APPROVAL DEBUG] Case Number: {st.session_state.case_number}")
-            print(f"[APPROVAL DEBUG] Bank Name: {st.session_state.bank_name}")
-
-            # Send email to bank
-            if not st.session_state.email_sent and st.session_state.nric and st.session_state.case_number:
-                print(f"[APPROVAL DEBUG] Initiating email send...")
-                email_sent, bank_email = send_bank_release_email(
-                    st.session_state.release_summary,
-                    st.session_state.nric,
-                    st.session_state.case_number,
-                    st.session_state.bank_name
-                )
-                if email_sent:
-                    st.session_state.email_sent = True
-                    bank_display = f"{st.session_state.bank_name} ({bank_email})" if st.session_state.bank_name else bank_email
-                    print(f"[APPROVAL DEBUG] ✓ Email sent successfully to {bank_display}")
-                    st.success(f"✉️ Bank appointment release notice sent to {bank_display}")
-                else:
-                    print(f"[APPROVAL DEBUG] ✗ Email sending failed")
+                summary = get_record_store().get_summary(st.session_state.nric, st.session_state.case_number)
+                if summary is not None and summary.has_appointment:
+                    bank_appointment_date = summary.appointment_date
+                    appointed_bank = summary.appointed_bank
+                    appointment_amount = summary.appointment_amount
+            except Exception as e:
+                logger.warning("Error loading bank appointment details: %s", e)
+
+            # Show actual values when NRIC and Case Number are provided
+            bank_appointment_html = ""
+            notice_in_flight = False
+            logger.debug("Portal: release_approved=%s appointment_date=%s bank=%s amount=%s",
+                         st.session_state.bank_appointment_release_approved, bank_appointment_date, appointed_bank, appointment_amount)
+
+            if st.session_state.bank_appointment_release_approved:
+                bank_info = f"{appointed_bank}" if appointed_bank and pd.notna(appointed_bank) else "N/A"
+                amount_info = f"S${appointment_amount:.2f}" if appointment_amount and pd.notna(appointment_amount) else "N/A"
+
+                bank_appointment_html = f"""<br><strong>Bank Appointment Date:</strong> {bank_appointment_date if bank_appointment_date else 'N/A'}
+                <br><strong>Appointed Bank:</strong> {bank_info}
+                <br><strong>Appointment Amount:</strong> {amount_info}
+                <br><strong style="color: #28a745;">Bank Appointment Release:</strong> <span style="color: #28a745;">In Progress ✓</span>"""
+
+                # Poll the outbox for the release notice's delivery status
+                notice = get_email_outbox()[0].status(release_reference(st.session_state.case_number))
+                if notice:
+                    notice_labels = {
+                        PENDING: "Queued" if notice["attempts"] == 0 else f"Retrying (attempt {notice['attempts']} failed)",
+                        SENDING: "Sending",
+                        SENT: "Sent to bank ✓",
+                        FAILED: "Delivery failed ✗",
+                    }
+                    bank_appointment_html += f"""
+                <br><strong>Release Notice:</strong> {notice_labels.get(notice['status'], notice['status'])}"""
+                    notice_in_flight = notice["status"] in (PENDING, SENDING)
+                    if notice["status"] == FAILED:
+                        st.error(f"❌ The release notice could not be delivered: {notice['last_error']}")
+            elif bank_appointment_date:
+                bank_info = f"{appointed_bank}" if appointed_bank and pd.notna(appointed_bank) else "N/A"
+                amount_info = f"S${appointment_amount:.2f}" if appointment_amount and pd.notna(appointment_amount) else "N/A"
+
+                bank_appointment_html = f"""<br><strong>Bank Appointment Date:</strong> {bank_appointment_date}
+                <br><strong>Appointed Bank:</strong> {bank_info}
+                <br><strong>Appointment Amount:</strong> {amount_info}"""
             else:
-                print(f"[APPROVAL DEBUG] Email not sent - Conditions not met:")
-                print(f"  - Email already sent: {st.session_state.email_sent}")
-                print(f"  - NRIC present: {bool(st.session_state.nric)}")
-                print(f"  - Case Number present: {bool(st.session_state.case_number)}")
+                bank_appointment_html = "<br><strong>Bank Appointment:</strong> None"
+
+            st.markdown(f"""
+            <div style="padding: 15px 0;">
+                <strong>NRIC:</strong> {st.session_state.nric} &nbsp;&nbsp;&nbsp;&nbsp; <strong>Case Number:</strong> {st.session_state.case_number}
+                {bank_appointment_html}
+            </div>
+            """, unsafe_allow_html=True)
+
+            # Re-polls the outbox by rerunning only the portal fragment
+            if notice_in_flight:
+                st.button("↻ Refresh delivery status", key="refresh_notice_status")
         else:
-            print(f"[APPROVAL DEBUG] ✗ Approval keyword NOT detected in response")
-
-        extracted_nric, extracted_case = extract_nric_case(full_response)
-        if extracted_nric:
-            st.session_state.nric = extracted_nric
-        if extracted_case:
-            st.session_state.case_number = extracted_case
-            
-        extracted_bank = extract_bank_name(full_response)
-        if extracted_bank:
-            st.session_state.bank_name = extracted_bank
-
-    except Exception as e:
-        error_message = f"Error: {str(e)}"
-        if "api_key" in str(e).lower():
-            error_message = "⚠️ OpenAI API key not found or invalid. Please check your .env file."
-        full_response = error_message
-
-    st.session_state.messages.append({"role": "assistant", "content": full_response})
-    
-    # Increment input key to clear the input field
-    st.session_state.input_key += 1
-    
-    # Rerun to show the new messages and clear input
-    st.rerun()
-
-# My Tax Portal Section
-st.markdown("---")
-st.markdown("""
-    <div style="background-color: #2D7BB9; padding: 20px; border-radius: 10px; margin-top: 10px;">
-        <h2 style="color: white; margin-top: 0;">My Tax Portal</h2>
-    </div>
-    """, unsafe_allow_html=True)
-
-# Auto-fetch fresh tax records from CSV whenever NRIC and Case Number are available
-if st.session_state.nric and st.session_state.case_number:
-    st.session_state.tax_records = load_tax_records(st.session_state.nric, st.session_state.case_number)
-
-# Display NRIC and Case Number
-if st.session_state.nric and st.session_state.case_number:
-    bank_appointment_date = None
-    appointed_bank = None
-    appointment_amount = None
-
-    # Load bank appointment details from CSV for display
-    try:
-        df = pd.read_csv("data/tax_records.csv")
-        filtered_df = df[(df['NRIC'] == st.session_state.nric) & (df['Case_Number'] == st.session_state.case_number)]
-        if not filtered_df.empty:
-            # Get the most recent bank appointment
-            if 'Bank_Appointment_Date' in filtered_df.columns:
-                appointments = filtered_df[filtered_df['Bank_Appointment_Date'].notna() & (filtered_df['Bank_Appointment_Date'] != '')]
-                if not appointments.empty:
-                    bank_appointment_date = appointments.iloc[-1]['Bank_Appointment_Date']
-
-                    # Get appointed bank and amount
-                    if 'Appointed_Bank' in appointments.columns:
-                        appointed_bank = appointments.iloc[-1]['Appointed_Bank']
-                    if 'Appointment_Amount' in appointments.columns:
-                        appointment_amount = appointments.iloc[-1]['Appointment_Amount']
-    except Exception as e:
-        print(f"[DEBUG] Error loading bank appointment details: {str(e)}")
-        pass
-
-    # Show actual values when NRIC and Case Number are provided
-    bank_appointment_html = ""
-
-    # -----------------------DEBUGGING-----------------------
-    print(f"[DISPLAY DEBUG] Bank Appointment Release Approved: {st.session_state.bank_appointment_release_approved}")
-    print(f"[DISPLAY DEBUG] Bank Appointment Date: {bank_appointment_date}")
-    print(f"[DISPLAY DEBUG] Appointed Bank: {appointed_bank}")
-    print(f"[DISPLAY DEBUG] Appointment Amount: {appointment_amount}")
-
-    if st.session_state.bank_appointment_release_approved:
-        bank_info = f"{appointed_bank}" if appointed_bank and pd.notna(appointed_bank) else "N/A"
-        amount_info = f"S${appointment_amount:.2f}" if appointment_amount and pd.notna(appointment_amount) else "N/A"
-
-        bank_appointment_html = f"""<br><strong>Bank Appointment Date:</strong> {bank_appointment_date if bank_appointment_date else 'N/A'}
-        <br><strong>Appointed Bank:</strong> {bank_info}
-        <br><strong>Appointment Amount:</strong> {amount_info}
-        <br><strong style="color: #28a745;">Bank Appointment Release:</strong> <span style="color: #28a745;">In Progress ✓</span>"""
-    elif bank_appointment_date:
-        bank_info = f"{appointed_bank}" if appointed_bank and pd.notna(appointed_bank) else "N/A"
-        amount_info = f"S${appointment_amount:.2f}" if appointment_amount and pd.notna(appointment_amount) else "N/A"
-
-        bank_appointment_html = f"""<br><strong>Bank Appointment Date:</strong> {bank_appointment_date}
-        <br><strong>Appointed Bank:</strong> {bank_info}
-        <br><strong>Appointment Amount:</strong> {amount_info}"""
-    else:
-        bank_appointment_html = "<br><strong>Bank Appointment:</strong> None"
+            # Show placeholders when no NRIC/Case Number provided yet
+            st.markdown("""
+            <div style="padding: 15px 0;">
+                <strong>NRIC:</strong> _________ &nbsp;&nbsp;&nbsp;&nbsp; <strong>Case Number:</strong> _________
+                <br><strong>Bank Appointment Status:</strong> _________
+            </div>
+            """, unsafe_allow_html=True)
+
+        # Display tax records table
+        if display_df is not None:
+            st.markdown("### Tax Assessment Records")
+
+            # Amounts stay numeric and are shown to 2 d.p.
+            money_format = st.column_config.NumberColumn(format=MONEY_FORMAT)
+
+            st.dataframe(display_df, use_container_width=True, hide_index=True,
+                         column_config={column: money_format for column in money_display_columns(display_df.columns)})
+        else:
+            if st.session_state.nric and st.session_state.case_number:
+                st.warning("⚠️ No matching tax records for the provided NRIC and Case Number.")
+            else:
+                st.info("ℹ️ Please mention your NRIC and Case Number in the chat to view your tax records.")
 
-    st.markdown(f"""
-    <div style="padding: 15px 0;">
-        <strong>NRIC:</strong> {st.session_state.nric} &nbsp;&nbsp;&nbsp;&nbsp; <strong>Case Number:</strong> {st.session_state.case_number}
-        {bank_appointment_html}
-    </div>
-    """, unsafe_allow_html=True)
-else:
-    # Show placeholders when no NRIC/Case Number provided yet
-    st.markdown("""
-    <div style="padding: 15px 0;">
-        <strong>NRIC:</strong> _________ &nbsp;&nbsp;&nbsp;&nbsp; <strong>Case Number:</strong> _________
-        <br><strong>Bank Appointment Status:</strong> _________
-    </div>
-    """, unsafe_allow_html=True)
 
-# Display tax records table
-if st.session_state.tax_records is not None:
-    st.markdown("### Tax Assessment Records")
-    
-    display_df = st.session_state.tax_records.copy()
-
-    if 'Payable' in display_df.columns:
-        display_df['Payable (S$)'] = display_df['Payable'].apply(lambda x: f"{x:.2f}")
-        display_df = display_df.drop('Payable', axis=1)
-
-    if 'Paid' in display_df.columns:
-        display_df['Paid (S$)'] = display_df['Paid'].apply(lambda x: f"{x:.2f}")
-        display_df = display_df.drop('Paid', axis=1)
-
-    if 'Balance' in display_df.columns:
-        display_df['Balance (S$)'] = display_df['Balance'].apply(lambda x: f"{x:.2f}")
-        display_df = display_df.drop('Balance', axis=1)
-
-    if 'Appointment_Amount' in display_df.columns:
-        display_df['Appointment Amount (S$)'] = display_df['Appointment_Amount'].apply(
-            lambda x: f"{x:.2f}" if pd.notna(x) and x != '' else ''
-        )
-        display_df = display_df.drop('Appointment_Amount', axis=1)
-
-    column_order = [
-        'Date',
-        'Description',
-        'Year_of_Assessment',
-        'Payable (S$)',
-        'Paid (S$)',
-        'Balance (S$)',
-        'Bank_Appointment_Date',
-        'Appointed_Bank',
-        'Appointment Amount (S$)'
-    ]
-    display_df = display_df[[col for col in column_order if col in display_df.columns]]
-
-    display_df = display_df.rename(columns={
-        'Year_of_Assessment': 'Year of Assessment',
-        'Bank_Appointment_Date': 'Bank Appt Date',
-        'Appointed_Bank': 'Appointed Bank'
-    })
-
-    st.dataframe(display_df, use_container_width=True, hide_index=True)
-else:
-    if st.session_state.nric and st.session_state.case_number:
-        st.warning("⚠️ No matching tax records for the provided NRIC and Case Number.")
-    else:
-        st.info("ℹ️ Please mention your NRIC and Case Number in the chat to view your tax records.")
+portal_section()
 
 
 # Sidebar with chat controls
@@ -897,13 +747,9 @@ with st.sidebar:
 
     if st.button("Clear Chat History"):
         st.session_state.messages = []
-        st.session_state.bank_appointment_info = {
-            "identification": {},
-            "bank_account": {},
-            "payment_evidence": {},
-            "authorisation": {},
-            "multiple_accounts": {}
-        }
+        st.session_state.history_shown = CHAT_HISTORY_WINDOW
+        st.session_state.render_cache.clear()
+        st.session_state.sop_state = SopState()
         st.session_state.bank_appointment_release_approved = False
         st.session_state.nric = ""
         st.session_state.case_number = ""
@@ -914,5 +760,8 @@ with st.sidebar:
         st.rerun()
 
     st.markdown("---")
-    st.markdown("**Model:** GPT-3.5 Turbo")
+    st.markdown(f"**Model:** {CHAT_MODEL}" + (f" (fast turns: {LLM_FAST_MODEL})" if LLM_FAST_MODEL else ""))
+    st.markdown(f"**Backend:** {LLM_BACKEND}")
     st.markdown("Built using Streamlit & OpenAI")
+
+st.session_state.full_app_run = False
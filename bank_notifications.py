@@ -0,0 +1,171 @@
+"""Bank appointment release notices: composing the email and delivering it over SMTP."""
+import os
+import smtplib
+from datetime import datetime
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+
+SMTP_AUTH_HELP = """❌ SMTP Authentication failed.
+
+        If you're using Gmail, you need to use an App Password (not your regular password).
+        Steps to fix:
+            1. Go to https://myaccount.google.com/apppasswords
+            2. Enable 2-Step Verification if not already enabled
+            3. Generate an App Password for 'AI_Bootcamp'
+            4. Update SENDER_PASSWORD in your .env file with the App Password"""
+
+
+def release_reference(case_number):
+    """Reference number of a case's release notice; also its idempotency key."""
+    return f"IRAS-BankAppt-{case_number}"
+
+
+def smtp_settings():
+    return {
+        "server": os.getenv("SMTP_SERVER", "smtp.gmail.com"),
+        "port": int(os.getenv("SMTP_PORT", "587")),
+        "starttls": os.getenv("SMTP_STARTTLS", "true").lower() == "true",
+        "sender_email": os.getenv("SENDER_EMAIL"),
+        "sender_password": os.getenv("SENDER_PASSWORD"),
+    }
+
+
+def build_release_email(release_details, nric, case_number, bank_name, bank_email, sender_email, iras_contact):
+    """Compose the release notice as a plain dict, ready to queue or send.
+
+    release_details is the rendered appointment, liability and verification
+    sections of the decided case (``sop_templates.render_release_details``).
+    """
+    now = datetime.now()
+    current_date = now.strftime("%d %B %Y")
+    current_time = now.strftime("%H:%M:%S")
+
+    body = f"""Dear Bank Officer,
+
+This email serves as an official notification from the Inland Revenue Authority of Singapore (IRAS) regarding a Bank Appointment Release for the taxpayer listed below.
+
+DOCUMENT INFORMATION
+------------------------------------------------------------
+Reference Number: IRAS-BankAppt-{case_number}
+Date of Issue   : {current_date}
+Time of Issue   : {current_time}
+Issued By       : Inland Revenue Authority of Singapore (IRAS)
+
+CASE SUMMARY
+------------------------------------------------------------
+The following verified information has been extracted from the case:
+
+{release_details}
+
+AUTHORISATION
+------------------------------------------------------------
+IRAS authorises {bank_name if bank_name else "the bank"} to proceed with the release of the affected bank account(s). All relevant checks have been completed, including identity verification and liability clearance.
+
+Verification Status:
+• Taxpayer identity confirmed
+• Tax liabilities fully settled
+• Bank account details validated
+• Release conditions met
+
+ACTION REQUIRED
+------------------------------------------------------------
+Please carry out the following steps:
+1. Process the bank appointment release as soon as possible
+2. Restore all affected account(s) to normal operation
+3. Notify the account holder upon completion
+4. Send release confirmation to IRAS
+
+CONTACT INFORMATION
+------------------------------------------------------------
+For queries or verification, you may contact IRAS at:
+• Phone          : {iras_contact['phone']}
+• Email          : {iras_contact['email']}
+• Website        : {iras_contact['website']}
+• Operating Hours: {iras_contact['hours']}
+
+NOTES
+------------------------------------------------------------
+• This email constitutes an official communication from IRAS.
+• You may verify the authenticity of this notice if required.
+• Please retain this email for your internal records.
+
+Thank you for your prompt attention to this matter.
+
+Yours sincerely,
+Inland Revenue Authority of Singapore (IRAS)
+
+============================================================
+Automated System Notification
+Generated by the IRAS Tax Buddy System
+Timestamp: {current_date}, {current_time}
+Reference: IRAS-BankAppt-{case_number}
+============================================================
+
+CONFIDENTIALITY NOTICE: This email and its contents are confidential and intended solely for the recipient. If you are not the intended recipient, please delete this email immediately and notify the sender.
+"""
+
+    return {
+        "reference": release_reference(case_number),
+        "sender": sender_email,
+        "recipient": bank_email,
+        "bank": bank_name or "",
+        "subject": f"IRAS Bank Appointment Release Notice - {nric} ({case_number})",
+        "body": body,
+    }
+
+
+def build_digest_email(emails):
+    """Combine several notices for the same bank into one digest email."""
+    first = emails[0]
+    references = [email["reference"] for email in emails]
+    separator = "\n\n" + "=" * 60 + "\n\n"
+    return {
+        "reference": ", ".join(references),
+        "sender": first["sender"],
+        "recipient": first["recipient"],
+        "bank": first["bank"],
+        "subject": f"IRAS Bank Appointment Release Notices - {len(emails)} cases",
+        # One reference per line: SMTP rejects lines over 998 characters, which a joined list soon exceeds
+        "body": (f"This digest contains {len(emails)} bank appointment release notices:\n"
+                 + "\n".join(f"- {reference}" for reference in references)
+                 + separator + separator.join(email["body"] for email in emails)),
+    }
+
+
+def to_mime(email):
+    msg = MIMEMultipart()
+    msg['From'] = email["sender"]
+    msg['To'] = email["recipient"]
+    msg['Subject'] = email["subject"]
+    msg.attach(MIMEText(email["body"], 'plain'))
+    return msg
+
+
+def open_smtp_session(settings, timeout=30):
+    """Connect, STARTTLS and log in; the caller owns (and must close) the session."""
+    server = smtplib.SMTP(settings["server"], settings["port"], timeout=timeout)
+    try:
+        if settings.get("starttls", True):
+            server.starttls()
+        if settings.get("sender_password"):
+            try:
+                server.login(settings["sender_email"], settings["sender_password"])
+            except smtplib.SMTPAuthenticationError as e:
+                raise smtplib.SMTPAuthenticationError(e.smtp_code, f"{SMTP_AUTH_HELP}\n\n        Error details: {e}") from e
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
+def send_email(email, settings=None):
+    """Deliver one notice over a fresh SMTP session; raises smtplib errors on failure."""
+    server = open_smtp_session(settings or smtp_settings())
+    try:
+        server.send_message(to_mime(email))
+    finally:
+        try:
+            server.quit()
+        except smtplib.SMTPException:
+            server.close()
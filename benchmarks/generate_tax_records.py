@@ -0,0 +1,194 @@
+"""Generate a synthetic tax records CSV at scale, in the schema of data/tax_records.csv.
+
+Each case is an "Original Assessment Due on ..." row followed by zero or
+more instalments (GIRO, PayNow, ...) that pay off part or all of it, with a
+running Balance; amounts are generated in cents, so Balance is exact. A
+share of the cases that still owe money have a bank appointment laid out as
+in the sample data: the appointed bank on every row of the case, and the
+appointment date and amount (the outstanding balance) on the last row.
+NRICs carry valid check letters, and a taxpayer may have several cases.
+
+Case numbers continue the sample's ``TXnnn`` series, zero-padded to as many
+digits as the largest number needs. The chat's input scanner only accepts
+``TX`` plus three digits, so cases past TX999 are for benchmarks that call
+the record store directly. ``--include-sample`` puts the four sample cases
+first, so benchmarks/load_test.py's scenarios run against the output too.
+
+Rows are written in batches of cases, so output size is not bounded by memory.
+Convert the CSV with tax_snapshot.py or sqlite_store.py for the other backends.
+
+    python benchmarks/generate_tax_records.py --cases 1000000 --include-sample /tmp/tax_records_1m.csv
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from case_index import NRIC_CHECK_LETTERS, NRIC_PREFIX_OFFSETS, NRIC_WEIGHTS, nric_check_letter  # noqa: E402
+
+SAMPLE_PATH = os.path.join(ROOT, "data", "tax_records.csv")
+SAMPLE_CASES = 4
+COLUMNS = ["NRIC", "Case_Number", "Date", "Description", "Year_of_Assessment", "Payable", "Paid", "Balance",
+           "Bank_Appointment_Date", "Appointed_Bank", "Appointment_Amount"]
+DEFAULT_BANKS = ("DBS", "UOB", "OCBC", "HSBC")
+
+# Mostly citizens (S/T), some foreigners (F/G/M)
+NRIC_PREFIXES = ("S", "T", "F", "G", "M")
+NRIC_PREFIX_WEIGHTS = (0.55, 0.30, 0.05, 0.07, 0.03)
+PAYMENT_METHODS = ("GIRO Payment", "PayNow QR Payment", "PayNow Payment", "Internet Banking Payment")
+FIRST_YEAR, LAST_YEAR = 2019, 2025
+
+
+def bank_names():
+    """Banks from BANK_EMAILS ("BANK:email,..."), as the app reads them, else the usual four."""
+    names = [pair.split(":", 1)[0].strip() for pair in os.getenv("BANK_EMAILS", "").split(",") if ":" in pair]
+    return tuple(name for name in names if name) or DEFAULT_BANKS
+
+
+def generate_nrics(rng, count):
+    """count distinct NRIC/FINs with valid check letters."""
+    prefix_index = rng.choice(len(NRIC_PREFIXES), count, p=NRIC_PREFIX_WEIGHTS)
+    prefixes = np.array(NRIC_PREFIXES)[prefix_index]
+    # Distinct across prefixes, so distinct overall
+    numbers = rng.choice(10_000_000, count, replace=False)
+    digits = (numbers[:, None] // 10 ** np.arange(6, -1, -1)) % 10
+    totals = digits @ np.array(NRIC_WEIGHTS) + np.array([NRIC_PREFIX_OFFSETS[p] for p in NRIC_PREFIXES])[prefix_index]
+    letters = np.empty(count, dtype="<U1")
+    for prefix, table in NRIC_CHECK_LETTERS.items():
+        mask = prefixes == prefix
+        letters[mask] = np.array(list(table))[totals[mask] % 11]
+    return np.char.add(np.char.add(prefixes, np.char.zfill(numbers.astype(str), 7)), letters)
+
+
+def generate_batch(rng, nrics, first_case, cases, width, banks, max_payments, appointment_rate):
+    """Ledger rows for case numbers first_case .. first_case + cases - 1."""
+    # Per case
+    case_nric = nrics[rng.integers(0, len(nrics), cases)]
+    case_number = np.char.add("TX", np.char.zfill(np.arange(first_case, first_case + cases).astype(str), width))
+    year = rng.integers(FIRST_YEAR, LAST_YEAR + 1, cases)
+    # Notice days from 1 Mar of the year of assessment, due a month later
+    notice = (pd.to_datetime(year.astype(str) + "-03-01").to_numpy().astype("datetime64[D]")
+              + rng.integers(0, 75, cases))
+    due = notice + 30
+    payable = np.round(rng.lognormal(7.0, 1.2, cases) * 100).astype(np.int64) + 100
+    payments = rng.integers(0, max_payments + 1, cases)
+    # Fully settled, or part paid so far
+    paid_share = np.where(rng.random(cases) < 0.6, 1.0, rng.uniform(0.0, 0.9, cases))
+    paid_total = np.where(payments > 0, np.round(payable * paid_share).astype(np.int64), 0)
+    method = rng.integers(0, len(PAYMENT_METHODS), cases)
+
+    # Per row: the assessment, then the case's instalments
+    rows_per_case = payments + 1
+    starts = np.cumsum(rows_per_case) - rows_per_case
+    case = np.repeat(np.arange(cases), rows_per_case)
+    position = np.arange(len(case)) - starts[case]
+    is_assessment = position == 0
+    is_last = position == payments[case]
+
+    instalment = paid_total // np.maximum(payments, 1)
+    row_paid = np.where(is_assessment, 0, instalment[case])
+    # The last instalment takes the remainder, so the instalments add up to paid_total
+    row_paid = np.where(is_last & ~is_assessment, paid_total[case] - instalment[case] * (payments[case] - 1), row_paid)
+    row_payable = np.where(is_assessment, payable[case], 0)
+    change = row_payable - row_paid
+    balance = np.cumsum(change) - np.repeat(np.cumsum(change)[starts] - change[starts], rows_per_case)
+
+    date = np.where(is_assessment, notice[case], due[case] - 20 + 30 * position + rng.integers(0, 10, len(case)))
+    description = np.where(is_assessment,
+                           np.char.add("Original Assessment Due on ", format_dates(due[case])),
+                           np.array(PAYMENT_METHODS)[method[case]])
+
+    appointed = (balance[starts + payments] > 0) & (rng.random(cases) < appointment_rate)
+    bank = np.array(banks)[rng.integers(0, len(banks), cases)]
+    row_appointed = appointed[case]
+    appointment_row = row_appointed & is_last
+    appointment_date = date.astype("datetime64[D]") + rng.integers(14, 45, len(case))
+
+    frame = pd.DataFrame({
+        "NRIC": case_nric[case],
+        "Case_Number": case_number[case],
+        "Date": format_dates(date),
+        "Description": description,
+        "Year_of_Assessment": year[case],
+        "Payable": row_payable / 100,
+        "Paid": row_paid / 100,
+        "Balance": balance / 100,
+        "Bank_Appointment_Date": np.where(appointment_row, format_dates(appointment_date), ""),
+        "Appointed_Bank": np.where(row_appointed, bank[case], ""),
+        "Appointment_Amount": np.where(appointment_row, balance / 100, np.nan),
+    })
+    return frame
+
+
+def format_dates(days):
+    """"%d %b %Y" labels, formatted once per distinct day rather than once per row."""
+    unique, inverse = np.unique(days.astype("datetime64[D]"), return_inverse=True)
+    return pd.DatetimeIndex(unique).strftime("%d %b %Y").to_numpy()[inverse]
+
+
+def write_records(path, cases, people, seed=0, batch_cases=200_000, max_payments=4, appointment_rate=0.3,
+                  banks=None, include_sample=False):
+    """Write the CSV; returns (rows, cases) written."""
+    rng = np.random.default_rng(seed)
+    banks = banks or bank_names()
+    nrics = generate_nrics(rng, people)
+    first_case = SAMPLE_CASES + 1
+    width = max(3, len(str(first_case + cases - 1)))
+    rows = total_cases = 0
+
+    with open(path, "w", newline="") as f:
+        header = True
+        if include_sample:
+            sample = pd.read_csv(SAMPLE_PATH)
+            sample.to_csv(f, index=False, float_format="%.2f")
+            rows, total_cases, header = len(sample), sample.groupby(["NRIC", "Case_Number"]).ngroups, False
+        for start in range(0, cases, batch_cases):
+            batch = generate_batch(rng, nrics, first_case + start, min(batch_cases, cases - start), width, banks,
+                                   max_payments, appointment_rate)
+            batch.to_csv(f, index=False, header=header, float_format="%.2f", columns=COLUMNS)
+            header = False
+            rows += len(batch)
+            total_cases += min(batch_cases, cases - start)
+    return rows, total_cases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", help="CSV path to write")
+    parser.add_argument("--cases", type=int, default=100_000, help="cases to generate")
+    parser.add_argument("--people", type=int, help="distinct NRICs the cases are spread over (default: 80%% of --cases)")
+    parser.add_argument("--max-payments", type=int, default=4, help="most instalments per case")
+    parser.add_argument("--appointment-rate", type=float, default=0.3,
+                        help="share of cases with an outstanding balance that have a bank appointment")
+    parser.add_argument("--banks", help="comma-separated banks (default: the banks in BANK_EMAILS, else DBS,UOB,OCBC,HSBC)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--include-sample", action="store_true", help="start with the cases in data/tax_records.csv")
+    args = parser.parse_args()
+
+    people = args.people or max(1, int(args.cases * 0.8))
+    if people > 10_000_000:
+        parser.error("--people cannot exceed 10,000,000 (NRICs have seven digits)")
+    banks = tuple(args.banks.split(",")) if args.banks else None
+
+    start = time.perf_counter()
+    rows, cases = write_records(args.output, args.cases, people, seed=args.seed, max_payments=args.max_payments,
+                                appointment_rate=args.appointment_rate, banks=banks,
+                                include_sample=args.include_sample)
+    elapsed = time.perf_counter() - start
+    size_mb = os.path.getsize(args.output) / 1e6
+    print(f"Wrote {rows} rows ({cases} cases, {people} NRICs) to {args.output}: {size_mb:.1f} MB in {elapsed:.1f} s")
+
+    # Spot-check the check letters against the app's own validation
+    nrics = pd.read_csv(args.output, usecols=["NRIC"], nrows=1000)["NRIC"]
+    generated = nrics[~nrics.isin(pd.read_csv(SAMPLE_PATH)["NRIC"])]
+    assert all(nric_check_letter(n) == n[8] for n in generated), "generated NRIC with a wrong check letter"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Per-message cost of scanning chat input: the old multi-pass checks vs InputScanner.
+
+The legacy path is reproduced here as it ran in app.py (separate searches,
+findall/match loops, a bank name scan and keyword lists). Both paths are
+checked to agree on every sample message before timing.
+
+    python benchmarks/input_scanner.py --repeat 20000
+"""
+import argparse
+import os
+import re
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from input_scanner import InputScanner  # noqa: E402
+
+BANKS = ["UOB", "DBS", "OCBC", "HSBC"]
+
+MESSAGES = [
+    "Hi, I would like to release my bank appointment",
+    "My NRIC is S1234567A and my case number is TX001",
+    "nric S123456 case TX01",
+    "Yes, I have the full amount available",
+    "The account is with DBS, last 4 digits 4821",
+    "How does GIRO work for income tax payments?",
+    "my identification number is 1234567 and case id TX12",
+    "It's OCBC, account number ending 9912",
+]
+
+
+def legacy_scan(text):
+    nric_match = re.search(r'\b[STFG]\d{7}[A-Z]\b', text, re.IGNORECASE)
+    case_match = re.search(r'\bTX\d{3}\b', text, re.IGNORECASE)
+    nric = nric_match.group(0).upper() if nric_match else None
+    case_number = case_match.group(0).upper() if case_match else None
+    if nric:
+        re.match(r'^[STFG]\d{7}[A-Z]$', nric.upper())
+    if case_number:
+        re.match(r'^TX\d{3}$', case_number.upper())
+
+    text_lower = text.lower()
+    mentions_nric = any(k in text_lower for k in ['nric', 'ic number', 'identification'])
+    mentions_case = any(k in text_lower for k in ['case number', 'case no', 'case id', 'tx'])
+    mentions_bank_account = any(k in text_lower for k in ['account', 'last 4 digits', 'last four', 'bank account', 'account number'])
+    has_digits = bool(re.search(r'\d+', text))
+
+    partial_nrics = [m for m in re.findall(r'\b[STFG]?\d{1,7}[A-Z]?\b', text, re.IGNORECASE)
+                     if m and not re.match(r'^[STFG]\d{7}[A-Z]$', m.upper()) and len(m) > 3]
+    partial_cases = [m for m in re.findall(r'\bTX\d{0,3}\b', text, re.IGNORECASE)
+                     if m and not re.match(r'^TX\d{3}$', m.upper())]
+
+    text_upper = text.upper()
+    bank = next((b for b in BANKS if b in text_upper), None)
+    return (nric, case_number, bank, mentions_nric, mentions_case, mentions_bank_account, has_digits,
+            partial_nrics, partial_cases)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20000, help="passes over the sample messages")
+    args = parser.parse_args()
+
+    scanner = InputScanner(BANKS)
+    for message in MESSAGES:
+        r = scanner.scan(message)
+        single = (r.nric, r.case_number, r.bank, r.mentions_nric, r.mentions_case, r.mentions_bank_account,
+                  r.has_digits, r.partial_nrics, r.partial_cases)
+        assert single == legacy_scan(message), (message, single, legacy_scan(message))
+
+    calls = args.repeat * len(MESSAGES)
+    for label, scan in (("legacy", legacy_scan), ("single-pass", scanner.scan)):
+        seconds = timeit.timeit(lambda: [scan(m) for m in MESSAGES], number=args.repeat)
+        print(f"{label:<12} {seconds / calls * 1e6:8.2f} us/message")
+
+
+if __name__ == "__main__":
+    main()
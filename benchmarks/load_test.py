@@ -0,0 +1,202 @@
+"""Replay scripted SOP conversations against the app and report per-turn costs.
+
+Each session is a headless Streamlit ``AppTest`` of app.py replaying the
+scenarios one conversation after another, so later conversations hit the
+process-wide ``st.cache_resource`` singletons (the record store and its case
+summaries, rendered portal tables, the FAQ response cache, the LLM backend and
+the email outbox) as they would on a running server. AppTest installs a process-global runtime for every
+script run, so concurrent sessions run in separate worker processes; they
+share one email outbox database. The model is the ``stub`` backend, and
+release notices go to a local aiosmtpd server that accepts any login, so
+nothing leaves the machine.
+
+Reported per scenario and overall:
+- p50/p95/p99 latency of a chat turn (the script run after a message is sent, and the rerun it triggers)
+- CSV reads per turn (calls to ``pandas.read_csv``)
+- prompt tokens per turn, from the ``taxbuddy_llm_tokens_total`` counter
+- session state per session (pickled size of the app's ``st.session_state`` keys)
+- peak RSS per worker process
+
+    pip install -r requirements-dev.txt
+    python benchmarks/load_test.py --sessions 8 --conversations 5
+"""
+import argparse
+import multiprocessing
+import os
+import pickle
+import resource
+import socket
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BANK_EMAILS = "DBS:dbs@example.com,UOB:uob@example.com,OCBC:ocbc@example.com,HSBC:hsbc@example.com"
+
+# name -> (messages, expected sop_state.decision at the end); the cases are in data/tax_records.csv
+SCENARIOS = {
+    "valid_case": (["Hi, my NRIC is S2222222B and my case number is TX002",
+                    "What happens to my bank appointment if I do nothing?"], None),
+    "no_appointment": (["NRIC S1111111A, case number TX001",
+                        "How do I pay my income tax by GIRO?"], None),
+    "insufficient_funds": (["My NRIC is S2222222B and case TX002", "yes", "no"], "REJECTED"),
+    "bank_mismatch": (["NRIC S3333333C case TX003", "yes", "yes", "DBS", "It is DBS"], "REJECTED"),
+    "approval": (["NRIC S2222222B case TX002", "yes", "yes", "DBS", "4821"], "APPROVED"),
+}
+
+# The app's own per-session state (widget values excluded)
+SESSION_KEYS = ("messages", "tax_records", "nric", "case_number", "sop_state", "release_summary", "bank_name",
+                "render_cache")
+
+
+class CountingHandler:
+    def __init__(self):
+        self.messages = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        return "250 Message accepted for delivery"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def accept_any_login(server, session, envelope, mechanism, auth_data):
+    return AuthResult(success=True)
+
+
+def count_calls(module, name, counter):
+    original = getattr(module, name)
+
+    def counted(*args, **kwargs):
+        counter[name] += 1
+        return original(*args, **kwargs)
+
+    setattr(module, name, counted)
+
+
+def prompt_tokens():
+    from telemetry import LLM_TOKENS
+    return sum(value for _, labels, value in LLM_TOKENS.samples() if labels.get("kind") == "prompt")
+
+
+def session_state_bytes(at):
+    return len(pickle.dumps({key: at.session_state[key] for key in SESSION_KEYS}))
+
+
+def run_conversation(name, counters):
+    from streamlit.testing.v1 import AppTest
+
+    messages, expected = SCENARIOS[name]
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+    at.session_state["password_correct"] = True
+    at.run()
+    latencies = []
+    reads_before, tokens_before = counters["read_csv"], prompt_tokens()
+    for message in messages:
+        at.text_input[0].input(message)
+        next(b for b in at.button if b.label == "▶").click()
+        start = time.perf_counter()
+        at.run()
+        latencies.append(time.perf_counter() - start)
+        if at.exception:
+            raise RuntimeError(f"{name}: {at.exception}")
+    return {
+        "latencies": latencies,
+        "csv_reads": counters["read_csv"] - reads_before,
+        "prompt_tokens": prompt_tokens() - tokens_before,
+        "state_bytes": [session_state_bytes(at)],
+        "ok": int(at.session_state["sop_state"].decision == expected),
+    }
+
+
+def share_script_cache():
+    """AppTest compiles the script afresh on every run, where a server compiles it once; share one cache."""
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.testing.v1 import app_test
+
+    cache = ScriptCache()
+    app_test.ScriptCache = lambda: cache
+
+
+def run_session(names):
+    """Worker process: replay the conversations in order; returns (results per conversation, peak RSS in KB)."""
+    os.chdir(ROOT)
+    share_script_cache()
+    counters = defaultdict(int)
+    count_calls(pd, "read_csv", counters)
+    results = [(name, run_conversation(name, counters)) for name in names]
+    return results, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=4, help="concurrent sessions (worker processes)")
+    parser.add_argument("--conversations", type=int, default=5, help="conversations replayed per session")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated scenario names")
+    parser.add_argument("--records", default=os.path.join(ROOT, "data", "tax_records.csv"), help="TAX_RECORDS_PATH")
+    args = parser.parse_args()
+    scenarios = args.scenarios.split(",")
+
+    handler = CountingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port(), authenticator=accept_any_login,
+                            auth_require_tls=False)
+    controller.start()
+    outbox_dir = tempfile.mkdtemp(prefix="taxbuddy-load-")
+    # Inherited by the worker processes, and read by app.py at import
+    os.environ.update({
+        "LLM_BACKEND": "stub",
+        "TAX_RECORDS_PATH": args.records,
+        "BANK_EMAILS": BANK_EMAILS,
+        "SMTP_SERVER": controller.hostname,
+        "SMTP_PORT": str(controller.port),
+        "SMTP_STARTTLS": "false",
+        "SENDER_EMAIL": "iras@example.com",
+        "SENDER_PASSWORD": "load-test",
+        "EMAIL_OUTBOX_PATH": os.path.join(outbox_dir, "outbox.db"),
+    })
+
+    plans = [[scenarios[(index + i) % len(scenarios)] for i in range(args.conversations)]
+             for index in range(args.sessions)]
+    start = time.perf_counter()
+    try:
+        with multiprocessing.get_context("spawn").Pool(args.sessions) as pool:
+            sessions = pool.map(run_session, plans)
+    finally:
+        controller.stop()
+    elapsed = time.perf_counter() - start
+
+    results = defaultdict(lambda: {"latencies": [], "csv_reads": 0, "prompt_tokens": 0, "state_bytes": [], "ok": 0})
+    for conversations, _ in sessions:
+        for name, r in conversations:
+            for key, value in r.items():
+                results[name][key] += value
+    rows = [(name, results[name]) for name in scenarios if name in results]
+    total = {key: sum((r[key] for _, r in rows), type(value)()) for key, value in rows[0][1].items()}
+
+    print(f"{args.sessions} sessions x {args.conversations} conversations in {elapsed:.1f} s, "
+          f"{handler.messages} emails delivered\n")
+    print(f"{'scenario':<20}{'turns':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'csv/turn':>10}"
+          f"{'tokens/turn':>13}{'state KB':>10}{'ok':>8}")
+    for name, r in rows + [("all", total)]:
+        turns = len(r["latencies"])
+        p50, p95, p99 = np.percentile(r["latencies"], [50, 95, 99]) * 1000
+        print(f"{name:<20}{turns:>6}{p50:>9.1f}{p95:>9.1f}{p99:>9.1f}{r['csv_reads'] / turns:>10.2f}"
+              f"{r['prompt_tokens'] / turns:>13.0f}{np.mean(r['state_bytes']) / 1024:>10.1f}"
+              f"{r['ok']:>5}/{len(r['state_bytes'])}")
+    print(f"\npeak RSS per session process {np.mean([rss for _, rss in sessions]) / 1024:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Cost of building the Tax Assessment Records table for a large case.
+
+Compares the old per-rerun formatting (row-wise ``.apply`` string passes,
+drops, reorder and rename, reproduced from app.py) with
+``format_records_table``, and with a cache hit on (NRIC, Case_Number,
+version) as the portal does on every rerun after the first.
+
+    python benchmarks/portal_table.py --rows 10000 --repeat 20
+"""
+import argparse
+import os
+import sys
+import timeit
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from portal_table import format_records_table  # noqa: E402
+
+
+def synthetic_case(rows, seed=0):
+    """One case's ledger as load_tax_records returns it (NRIC and Case_Number dropped)."""
+    rng = np.random.default_rng(seed)
+    payable = np.where(rng.random(rows) < 0.3, rng.integers(100, 500000, rows) / 100, 0.0)
+    paid = np.where(payable == 0, rng.integers(100, 200000, rows) / 100, 0.0)
+    appointed = rng.random(rows) < 0.2
+    dates = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 2000, rows), unit="D")
+    return pd.DataFrame({
+        "Date": dates.strftime("%d %b %Y"),
+        "Description": np.where(payable > 0, "Original Assessment", "GIRO Payment"),
+        "Year_of_Assessment": dates.year,
+        "Payable": payable,
+        "Paid": paid,
+        "Balance": np.maximum(np.cumsum(payable - paid), 0.0),
+        "Bank_Appointment_Date": pd.Series(dates.strftime("%d %b %Y")).where(appointed),
+        "Appointed_Bank": pd.Series(rng.choice(["DBS", "UOB", "OCBC", "HSBC"], rows)).where(appointed),
+        "Appointment_Amount": pd.Series(rng.integers(100, 200000, rows) / 100).where(appointed),
+    })
+
+
+def legacy_format(records):
+    display_df = records.copy()
+    for column in ("Payable", "Paid", "Balance"):
+        display_df[f"{column} (S$)"] = display_df[column].apply(lambda x: f"{x:.2f}")
+        display_df = display_df.drop(column, axis=1)
+    display_df["Appointment Amount (S$)"] = display_df["Appointment_Amount"].apply(
+        lambda x: f"{x:.2f}" if pd.notna(x) and x != '' else ''
+    )
+    display_df = display_df.drop("Appointment_Amount", axis=1)
+    column_order = ["Date", "Description", "Year_of_Assessment", "Payable (S$)", "Paid (S$)", "Balance (S$)",
+                    "Bank_Appointment_Date", "Appointed_Bank", "Appointment Amount (S$)"]
+    display_df = display_df[[col for col in column_order if col in display_df.columns]]
+    return display_df.rename(columns={
+        "Year_of_Assessment": "Year of Assessment",
+        "Bank_Appointment_Date": "Bank Appt Date",
+        "Appointed_Bank": "Appointed Bank",
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10000, help="ledger rows in the case")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per variant")
+    args = parser.parse_args()
+
+    records = synthetic_case(args.rows)
+    legacy, formatted = legacy_format(records), format_records_table(records)
+    assert list(legacy.columns) == list(formatted.columns)
+    assert (legacy["Balance (S$)"] == formatted["Balance (S$)"].map("{:.2f}".format)).all()
+
+    cached = lru_cache(maxsize=256)(lambda nric, case_number, version: format_records_table(records))
+    cached("S1234567D", "TX001", 1)
+
+    variants = (
+        ("legacy format", lambda: legacy_format(records)),
+        ("vectorised format", lambda: format_records_table(records)),
+        ("cache hit", lambda: cached("S1234567D", "TX001", 1)),
+    )
+    print(f"{args.rows} rows")
+    for label, run in variants:
+        seconds = min(timeit.repeat(run, number=1, repeat=args.repeat))
+        print(f"{label:<18} {seconds * 1e6:10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""How record loading, case summaries and portal rendering scale with the size of the tax records.
+
+Run against a file from benchmarks/generate_tax_records.py (or its snapshot
+or SQLite conversion). Reports:
+- opening the store: parse, (NRIC, Case_Number) index and per-case summaries
+- ``summarize_cases`` over the whole ledger on its own
+- a chat turn's record load: ``refresh()`` with nothing changed plus
+  ``get_records`` and the column drop, as app.py's ``load_tax_records``
+- ``get_summary``, as the SOP's appointment checks read it
+- the portal table: ``format_records_table`` on a case's records
+- the old per-lookup ``pd.read_csv`` and boolean filter, for comparison
+
+Per-lookup timings are over cases sampled at random from the file.
+
+    python benchmarks/generate_tax_records.py --cases 1000000 /tmp/tax_records_1m.csv
+    python benchmarks/record_scale.py /tmp/tax_records_1m.csv --backend csv
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from case_summary import summarize_cases  # noqa: E402
+from portal_table import format_records_table  # noqa: E402
+from record_store import RECORD_BACKENDS, TaxRecordStore, open_record_store  # noqa: E402
+
+
+def load_tax_records(store, nric, case_number):
+    """app.py's load_tax_records without the Streamlit error reporting."""
+    store.refresh()
+    records = store.get_records(nric, case_number)
+    return None if records is None else records.drop(["NRIC", "Case_Number"], axis=1)
+
+
+def legacy_load(path, nric, case_number):
+    df = pd.read_csv(path)
+    records = df[(df["NRIC"] == nric) & (df["Case_Number"] == case_number)]
+    return None if records.empty else records.drop(["NRIC", "Case_Number"], axis=1)
+
+
+def per_call(run, keys):
+    """(p50, p99) seconds of run(nric, case_number) over keys."""
+    timings = []
+    for nric, case_number in keys:
+        start = time.perf_counter()
+        run(nric, case_number)
+        timings.append(time.perf_counter() - start)
+    return np.percentile(timings, [50, 99])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("records", help="tax records CSV, snapshot directory or SQLite database")
+    parser.add_argument("--backend", choices=RECORD_BACKENDS, help="inferred from the path by default")
+    parser.add_argument("--lookups", type=int, default=1000, help="cases sampled for the per-lookup timings")
+    parser.add_argument("--legacy-lookups", type=int, default=3,
+                        help="cases looked up by re-reading the whole CSV (0 to skip; CSV backend only)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    store = open_record_store(args.records, args.backend)
+    open_seconds = time.perf_counter() - start
+    keys = list(store.case_keys())
+    rng = np.random.default_rng(args.seed)
+    sample = [keys[i] for i in rng.choice(len(keys), min(args.lookups, len(keys)), replace=False)]
+
+    print(f"{args.records}: {len(keys)} cases, backend {type(store).__name__}")
+    print(f"{'open store':<28}{open_seconds * 1000:>12.1f} ms")
+
+    legacy = 0
+    if isinstance(store, TaxRecordStore):
+        df = pd.read_csv(args.records)
+        start = time.perf_counter()
+        summarize_cases(df)
+        print(f"{'summarize_cases':<28}{(time.perf_counter() - start) * 1000:>12.1f} ms  ({len(df)} rows)")
+        del df
+        legacy = args.legacy_lookups
+
+    print(f"\n{'per lookup':<28}{'p50 us':>12}{'p99 us':>12}")
+    records = {key: store.get_records(*key) for key in sample}
+    variants = (
+        ("load_tax_records", lambda nric, case: load_tax_records(store, nric, case)),
+        ("get_summary", store.get_summary),
+        ("format_records_table", lambda nric, case: format_records_table(records[(nric, case)])),
+    )
+    for label, run in variants:
+        p50, p99 = per_call(run, sample)
+        print(f"{label:<28}{p50 * 1e6:>12.1f}{p99 * 1e6:>12.1f}")
+    if legacy:
+        p50, p99 = per_call(lambda nric, case: legacy_load(args.records, nric, case), sample[:legacy])
+        print(f"{'legacy read_csv + filter':<28}{p50 * 1e6:>12.1f}{p99 * 1e6:>12.1f}")
+
+    print(f"\npeak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Release notice delivery throughput: fresh sessions vs pooled vs batched.
+
+Starts a local aiosmtpd server (no TLS, no AUTH) that just counts messages,
+then delivers the same set of notices spread across the banks four ways:
+a fresh connection per notice (``send_email``), the pool with no batching,
+one pooled session per bank, and one digest email per bank.
+
+    pip install -r requirements-dev.txt
+    python benchmarks/smtp_throughput.py --notices 200 --connect-delay 0.05
+
+``--connect-delay`` adds a sleep to every new session to stand in for the
+TLS handshake and AUTH round-trips of a real relay.
+"""
+import argparse
+import os
+import socket
+import sys
+import time
+
+from aiosmtpd.controller import Controller
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bank_notifications import open_smtp_session, send_email  # noqa: E402
+from smtp_pool import BATCH_MODES, SMTPConnectionPool, deliver_batch  # noqa: E402
+
+DEFAULT_BANKS = "DBS:dbs@example.com,OCBC:ocbc@example.com,UOB:uob@example.com,POSB:posb@example.com"
+
+
+class CountingHandler:
+    def __init__(self):
+        self.messages = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages += 1
+        return "250 Message accepted for delivery"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def bank_mapping():
+    mapping = {}
+    for entry in os.getenv("BANK_EMAILS", DEFAULT_BANKS).split(","):
+        if ":" in entry:
+            bank, email = entry.split(":", 1)
+            mapping[bank.strip()] = email.strip()
+    return mapping
+
+
+def make_notices(count, banks):
+    names = list(banks)
+    notices = []
+    for i in range(count):
+        bank = names[i % len(names)]
+        case_number = f"TX{i:06d}"
+        notices.append({
+            "reference": f"IRAS-BankAppt-{case_number}",
+            "sender": "iras@example.com",
+            "recipient": banks[bank],
+            "bank": bank,
+            "subject": f"Bank Appointment Release - Case {case_number}",
+            "body": f"Please release the bank appointment for case {case_number}.\n",
+        })
+    return notices
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notices", type=int, default=200)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--connect-delay", type=float, default=0.0,
+                        help="seconds added to every new SMTP session")
+    args = parser.parse_args()
+
+    handler = CountingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    settings = {
+        "server": controller.hostname,
+        "port": controller.port,
+        "starttls": False,
+        "sender_email": "iras@example.com",
+        "sender_password": None,
+    }
+
+    def connect(settings):
+        time.sleep(args.connect_delay)
+        return open_smtp_session(settings)
+
+    banks = bank_mapping()
+    notices = make_notices(args.notices, banks)
+    print(f"{len(notices)} notices across {len(banks)} banks, connect delay {args.connect_delay * 1000:.0f} ms\n")
+    print(f"{'mode':<16}{'seconds':>10}{'notices/s':>12}{'sessions':>10}{'emails':>8}")
+
+    total_failed = 0
+    try:
+        runs = [("fresh", None)] + [(f"pool/{mode}", mode) for mode in BATCH_MODES]
+        for label, mode in runs:
+            before = handler.messages
+            start = time.perf_counter()
+            if mode is None:
+                for notice in notices:
+                    time.sleep(args.connect_delay)
+                    send_email(notice, settings)
+                sessions = len(notices)
+            else:
+                pool = SMTPConnectionPool(settings, size=args.pool_size, connect=connect)
+                results = deliver_batch(pool, notices, mode=mode)
+                pool.close()
+                failed = [ref for ref, error in results.items() if error is not None]
+                if failed:
+                    print(f"  {len(failed)} notices failed in {label}: {results[failed[0]]!r}")
+                    total_failed += len(failed)
+                sessions = pool.stats["connects"]
+            elapsed = time.perf_counter() - start
+            print(f"{label:<16}{elapsed:>10.3f}{len(notices) / elapsed:>12.1f}{sessions:>10}"
+                  f"{handler.messages - before:>8}")
+    finally:
+        controller.stop()
+    if total_failed:
+        sys.exit(f"{total_failed} notices failed")
+
+
+if __name__ == "__main__":
+    main()
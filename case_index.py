@@ -0,0 +1,35 @@
+"""Local identifier checks that run before any record load or model call.
+
+``is_valid_nric`` verifies the NRIC/FIN check letter (S, T, F, G and M
+series). Whether an NRIC or case is on file is asked of the record store
+itself (``has_nric`` and ``in``), which answers from its own index: a dict
+or set for the CSV store, a binary search for a snapshot and an indexed
+query for SQLite. A typo or an unknown case is rejected without a record
+load or an API round-trip, and no process holds a second copy of the keys.
+"""
+
+NRIC_WEIGHTS = (2, 7, 6, 5, 4, 3, 2)
+# Added to the weighted digit sum for each prefix
+NRIC_PREFIX_OFFSETS = {"S": 0, "T": 4, "F": 0, "G": 4, "M": 3}
+# Check letters indexed by (sum % 11)
+NRIC_CHECK_LETTERS = {
+    "S": "JZIHGFEDCBA",
+    "T": "JZIHGFEDCBA",
+    "F": "XWUTRQPNMLK",
+    "G": "XWUTRQPNMLK",
+    "M": "XWUTRQPNJLK",
+}
+
+
+def nric_check_letter(nric):
+    """Expected check letter for an NRIC/FIN, or None if it is not prefix + 7 digits."""
+    nric = nric.upper()
+    prefix, digits = nric[:1], nric[1:8]
+    if prefix not in NRIC_PREFIX_OFFSETS or len(digits) != 7 or not digits.isdigit():
+        return None
+    total = NRIC_PREFIX_OFFSETS[prefix] + sum(int(d) * w for d, w in zip(digits, NRIC_WEIGHTS))
+    return NRIC_CHECK_LETTERS[prefix][total % 11]
+
+
+def is_valid_nric(nric):
+    return len(nric) == 9 and nric_check_letter(nric) == nric[8:].upper()
@@ -0,0 +1,95 @@
+"""Per-case summary of a tax ledger: totals, current balance and latest appointment."""
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+KEY_COLUMNS = ["NRIC", "Case_Number"]
+
+
+@dataclass(frozen=True, slots=True)
+class CaseSummary:
+    nric: str
+    case_number: str
+    year_of_assessment: int | None
+    total_payable: float
+    total_paid: float
+    current_balance: float
+    appointed_bank: str | None = None
+    appointment_amount: float | None = None
+    appointment_date: str | None = None
+
+    @property
+    def has_appointment(self):
+        return self.appointment_date is not None
+
+
+def _clean(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _year(value):
+    value = _clean(value)
+    return None if value is None else int(value)
+
+
+def summarize_cases(df):
+    """Summarise every case in df in one vectorised pass.
+
+    Returns a DataFrame indexed by (NRIC, Case_Number). "Current" values come
+    from each case's last row and the appointment from its last row with a
+    Bank_Appointment_Date, both in file order. ``appointment_row`` is the
+    index label of that row, or -1 when the case has no appointment.
+    """
+    grouped = df.groupby(KEY_COLUMNS, sort=False)
+    summary = grouped[["Payable", "Paid"]].sum()
+    summary.columns = ["total_payable", "total_paid"]
+
+    last_rows = grouped.tail(1).set_index(KEY_COLUMNS)
+    summary["current_balance"] = last_rows["Balance"]
+    summary["year_of_assessment"] = last_rows["Year_of_Assessment"]
+
+    dates = df["Bank_Appointment_Date"]
+    appointments = df[dates.notna() & (dates != "")]
+    latest = appointments.groupby(KEY_COLUMNS, sort=False).tail(1)
+    latest = latest.rename_axis("appointment_row").reset_index().set_index(KEY_COLUMNS)
+
+    summary = summary.join(latest[["appointment_row", "Year_of_Assessment", "Appointed_Bank",
+                                   "Appointment_Amount", "Bank_Appointment_Date"]])
+    summary["year_of_assessment"] = summary["Year_of_Assessment"].fillna(summary["year_of_assessment"])
+    summary["appointment_row"] = summary["appointment_row"].fillna(-1).astype("int64")
+    return summary.drop(columns="Year_of_Assessment").rename(columns={
+        "Appointed_Bank": "appointed_bank",
+        "Appointment_Amount": "appointment_amount",
+        "Bank_Appointment_Date": "appointment_date",
+    })
+
+
+def case_summaries(summary):
+    """Turn a summarize_cases() frame into a {(NRIC, Case_Number): CaseSummary} dict."""
+    result = {}
+    for (nric, case_number), row in zip(summary.index, summary.itertuples(index=False)):
+        has_appointment = row.appointment_row >= 0
+        result[(nric, case_number)] = CaseSummary(
+            nric=nric,
+            case_number=case_number,
+            year_of_assessment=_year(row.year_of_assessment),
+            total_payable=float(row.total_payable),
+            total_paid=float(row.total_paid),
+            current_balance=float(row.current_balance),
+            appointed_bank=_clean(row.appointed_bank) if has_appointment else None,
+            appointment_amount=_clean(row.appointment_amount) if has_appointment else None,
+            appointment_date=_clean(row.appointment_date) if has_appointment else None,
+        )
+    return result
+
+
+def summarize_case(rows):
+    """Summarise the rows of a single case; returns a CaseSummary or None."""
+    if rows is None or rows.empty:
+        return None
+    return next(iter(case_summaries(summarize_cases(rows)).values()))
@@ -0,0 +1,60 @@
+"""Windowed rendering of the chat history.
+
+The chat used to redraw every message of the session on every rerun, so the
+render time and the websocket payload grew with the length of the
+conversation. Now only the most recent window of messages is drawn, with a
+button to page older ones in, and each message's display markdown is
+prepared once and cached under the message's ID.
+
+Display markdown differs from the stored text in one way: dollar signs are
+escaped, because Streamlit renders text between two ``$`` as LaTeX and
+replies quoting amounts such as "S$750.00 ... S$1250.00" were garbled.
+"""
+import re
+import uuid
+from collections import OrderedDict
+
+# A "$" not already escaped
+UNESCAPED_DOLLAR = re.compile(r"(?<!\\)\$")
+
+
+def new_message(role, content):
+    """Chat message with a stable ID; only role and content are ever sent to the model."""
+    return {"id": uuid.uuid4().hex, "role": role, "content": content}
+
+
+def to_markdown(content):
+    return UNESCAPED_DOLLAR.sub(r"\\$", content)
+
+
+def history_window(messages, shown):
+    """Split the history into (number of earlier messages hidden, the last ``shown`` messages)."""
+    hidden = max(0, len(messages) - shown)
+    return hidden, messages[hidden:]
+
+
+class RenderCache:
+    """Display markdown per message ID, least recently used entries evicted first."""
+
+    def __init__(self, max_entries=200):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def markdown(self, message):
+        message_id = message.get("id")
+        if message_id is None:
+            return to_markdown(message["content"])
+        rendered = self._entries.get(message_id)
+        if rendered is None:
+            rendered = self._entries[message_id] = to_markdown(message["content"])
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(message_id)
+        return rendered
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,75 @@
+"""Bounded conversation context for the chat completion call.
+
+The last few turns are sent verbatim; anything older is replaced by a short
+structured summary of the SOP facts collected so far, and the whole prompt is
+kept within a token budget counted locally.
+"""
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:  # pragma: no cover - tiktoken is optional
+    tiktoken = None
+
+# Per-message overhead of the chat format (role and separators)
+MESSAGE_TOKEN_OVERHEAD = 4
+
+
+@lru_cache(maxsize=None)
+def _encoding(model):
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except Exception:
+        # Unknown model name, or the BPE file could not be fetched
+        return None
+
+
+def count_tokens(text, model="gpt-3.5-turbo"):
+    """Count tokens with tiktoken when available, else estimate ~4 characters per token."""
+    encoding = _encoding(model)
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text))
+
+
+def count_message_tokens(messages, model="gpt-3.5-turbo"):
+    return sum(count_tokens(m["content"], model) + MESSAGE_TOKEN_OVERHEAD for m in messages)
+
+
+def format_facts_summary(facts, omitted_messages, nric="", case_number=""):
+    fund = facts.get("fund_available")
+    fund_text = "Not yet asked" if fund is None else ("YES" if fund else "NO")
+    return f"""EARLIER CONVERSATION SUMMARY ({omitted_messages} earlier messages omitted):
+- NRIC: {nric or 'Not provided'}
+- Case Number: {case_number or 'Not provided'}
+- Fund availability confirmed: {fund_text}
+- Bank account confirmed: {facts.get('bank_confirmed') or 'Not yet provided'}
+- Account last 4 digits: {facts.get('account_last4') or 'Not yet provided'}
+Continue the SOP from where these facts leave off; do not ask for them again."""
+
+
+def build_context_messages(system_messages, history, facts, max_turns=6, token_budget=6000,
+                           nric="", case_number="", model="gpt-3.5-turbo"):
+    """Assemble the messages for one completion call.
+
+    Keeps the last max_turns user/assistant pairs verbatim and summarises the
+    rest. If the result still exceeds token_budget, the oldest verbatim
+    messages are folded into the summary as well; the latest message is
+    always kept.
+    """
+    history = [{"role": m["role"], "content": m["content"]} for m in history]
+    keep = min(len(history), max_turns * 2)
+    fixed_tokens = count_message_tokens(system_messages, model)
+    recent_tokens = [count_tokens(m["content"], model) + MESSAGE_TOKEN_OVERHEAD for m in history]
+
+    while True:
+        omitted = len(history) - keep
+        summary = []
+        if omitted:
+            summary = [{"role": "system", "content": format_facts_summary(facts, omitted, nric, case_number)}]
+        total = fixed_tokens + count_message_tokens(summary, model) + sum(recent_tokens[omitted:])
+        if total <= token_budget or keep <= 1:
+            return list(system_messages) + summary + history[omitted:]
+        keep -= 1
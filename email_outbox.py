@@ -0,0 +1,221 @@
+"""Durable outbox for bank appointment release notices.
+
+Approved releases are written to a SQLite outbox and return immediately; a
+background worker delivers them with retries and exponential backoff. Each
+notice is keyed by its reference number (``IRAS-BankAppt-{case_number}``),
+so a case can only ever be sent once; queuing a notice that failed for good
+puts it back in the queue with a fresh set of attempts.
+"""
+import json
+import random
+import sqlite3
+import threading
+import time
+
+from telemetry import get_logger, span
+
+logger = get_logger("email")
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+CREATE_OUTBOX_SQL = """
+    CREATE TABLE IF NOT EXISTS outbox (
+        reference TEXT PRIMARY KEY,
+        recipient TEXT NOT NULL,
+        bank TEXT,
+        payload TEXT NOT NULL,
+        status TEXT NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        last_error TEXT,
+        created_at REAL NOT NULL,
+        sent_at REAL
+    )
+"""
+CREATE_DUE_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, next_attempt_at)"
+
+
+class EmailOutbox:
+    """SQLite-backed queue of outgoing notices, safe to share across threads and processes."""
+
+    def __init__(self, path, max_attempts=6, base_delay=5.0, max_delay=600.0):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute(CREATE_OUTBOX_SQL)
+            conn.execute(CREATE_DUE_INDEX_SQL)
+
+    def enqueue(self, email):
+        """Queue a notice, or re-queue it if it failed; returns False if it is already queued or sent."""
+        now = time.time()
+        with self._connection() as conn:
+            cursor = conn.execute(
+                "INSERT INTO outbox (reference, recipient, bank, payload, status, next_attempt_at, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (reference) DO UPDATE SET recipient = excluded.recipient, bank = excluded.bank, "
+                "payload = excluded.payload, status = excluded.status, attempts = 0, "
+                "next_attempt_at = excluded.next_attempt_at, last_error = NULL "
+                "WHERE outbox.status = ?",
+                (email["reference"], email["recipient"], email.get("bank"), json.dumps(email), PENDING, now, now,
+                 FAILED),
+            )
+        return cursor.rowcount == 1
+
+    def status(self, reference):
+        """Delivery status of a notice as a dict, or None if it was never queued."""
+        row = self._connection().execute(
+            "SELECT status, attempts, last_error, recipient, created_at, sent_at FROM outbox WHERE reference = ?",
+            (reference,),
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ("status", "attempts", "last_error", "recipient", "created_at", "sent_at")
+        return dict(zip(keys, row))
+
+    def claim_due(self, limit=50):
+        """Mark up to limit due notices as sending and return their payloads.
+
+        The status check in the UPDATE makes the claim atomic, so several
+        worker processes can drain the same outbox without double-sending.
+        """
+        conn = self._connection()
+        references = [row[0] for row in conn.execute(
+            "SELECT reference FROM outbox WHERE status = ? AND next_attempt_at <= ? "
+            "ORDER BY next_attempt_at LIMIT ?",
+            (PENDING, time.time(), limit),
+        )]
+
+        claimed = []
+        for reference in references:
+            with conn:
+                cursor = conn.execute(
+                    "UPDATE outbox SET status = ?, next_attempt_at = ? WHERE reference = ? AND status = ?",
+                    (SENDING, time.time(), reference, PENDING),
+                )
+            if cursor.rowcount == 1:
+                payload = conn.execute("SELECT payload FROM outbox WHERE reference = ?", (reference,)).fetchone()[0]
+                claimed.append(json.loads(payload))
+        return claimed
+
+    def mark_sent(self, reference):
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = NULL, sent_at = ? WHERE reference = ?",
+                (SENT, time.time(), reference),
+            )
+
+    def mark_failed(self, reference, error, permanent=False):
+        """Record a failed attempt and schedule a retry, or give up after max_attempts."""
+        conn = self._connection()
+        attempts = conn.execute("SELECT attempts FROM outbox WHERE reference = ?", (reference,)).fetchone()[0] + 1
+        if permanent or attempts >= self.max_attempts:
+            status, next_attempt_at = FAILED, time.time()
+        else:
+            status, next_attempt_at = PENDING, time.time() + self.backoff(attempts)
+        with conn:
+            conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE reference = ?",
+                (status, attempts, next_attempt_at, str(error), reference),
+            )
+
+    def requeue_stale(self, older_than=300.0):
+        """Return notices stuck in sending (e.g. the process died mid-send) to the queue."""
+        with self._connection() as conn:
+            conn.execute(
+                "UPDATE outbox SET status = ? WHERE status = ? AND next_attempt_at <= ?",
+                (PENDING, SENDING, time.time() - older_than),
+            )
+
+    def backoff(self, attempts):
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempts - 1)))
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+
+class OutboxWorker(threading.Thread):
+    """Background thread that drains the outbox through a send function.
+
+    ``send(email)`` delivers one notice and raises on failure. Alternatively
+    ``send_batch(emails)`` delivers everything claimed in one drain and
+    returns {reference: exception or None}. Exceptions listed in
+    ``permanent_errors`` fail the notice at once instead of retrying.
+
+    Every ``stale_check_interval`` seconds the worker also returns notices
+    left in sending for ``stale_after`` seconds (their sender died) to the
+    queue, so a worker that dies after startup does not strand them.
+    """
+
+    def __init__(self, outbox, send=None, poll_interval=5.0, permanent_errors=(), send_batch=None,
+                 stale_after=300.0, stale_check_interval=60.0):
+        super().__init__(name="email-outbox-worker", daemon=True)
+        self.outbox = outbox
+        self.send = send
+        self.send_batch = send_batch
+        self.poll_interval = poll_interval
+        self.permanent_errors = tuple(permanent_errors)
+        self.stale_after = stale_after
+        self.stale_check_interval = stale_check_interval
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+
+    def wake(self):
+        """Drain now instead of waiting for the next poll."""
+        self._wake.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def run(self):
+        next_stale_check = 0.0
+        while not self._stopped.is_set():
+            if time.monotonic() >= next_stale_check:
+                self.outbox.requeue_stale(self.stale_after)
+                next_stale_check = time.monotonic() + self.stale_check_interval
+            self.drain()
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def drain(self):
+        """Send every notice that is due; returns the number delivered."""
+        emails = self.outbox.claim_due()
+        if not emails:
+            return 0
+
+        with span("smtp_send", emails=len(emails)):
+            if self.send_batch is not None:
+                try:
+                    results = self.send_batch(emails)
+                except Exception as e:
+                    results = {email["reference"]: e for email in emails}
+            else:
+                results = {}
+                for email in emails:
+                    try:
+                        self.send(email)
+                        results[email["reference"]] = None
+                    except Exception as e:
+                        results[email["reference"]] = e
+
+        delivered = 0
+        for reference, error in results.items():
+            if error is None:
+                self.outbox.mark_sent(reference)
+                delivered += 1
+            else:
+                logger.warning("Delivery of %s failed: %s", reference, error)
+                self.outbox.mark_failed(reference, error, permanent=isinstance(error, self.permanent_errors))
+        return delivered
@@ -0,0 +1,119 @@
+"""Single-pass scanner for chat input.
+
+Every message used to go through a handful of separate regex searches,
+findall/match loops, a linear scan over the bank names and four keyword
+``any(... in ...)`` lists. ``InputScanner`` compiles all of them into one
+alternation with named groups and walks the message once, producing the
+NRIC and case number, the mentioned bank, partial-identifier warnings and
+the intent flags together.
+
+Matching rules are unchanged: identifiers and partial identifiers match on
+word boundaries, keywords and bank names match anywhere (as substrings did).
+The one difference is that when several banks are named, the first one in
+the message wins rather than the first in the bank mapping.
+
+The message is lowercased once and matched case-sensitively, and a leading
+lookahead on the possible first characters lets the engine skip positions
+where no alternative can start; both are much cheaper than IGNORECASE
+alternation tried at every character.
+"""
+import re
+from dataclasses import dataclass, field
+
+NRIC_KEYWORDS = ("nric", "ic number", "identification")
+CASE_KEYWORDS = ("case number", "case no", "case id", "tx")
+BANK_ACCOUNT_KEYWORDS = ("last 4 digits", "last four", "bank account", "account number", "account")
+
+# Alternatives are tried in this order at each position, so full identifiers win over partial ones.
+# Patterns are lowercase: they run against the lowercased message.
+TOKEN_PATTERNS = (
+    ("nric", r"\b[stfgm]\d{7}[a-z]\b"),
+    ("case", r"\btx\d{3}\b"),
+    ("partial_case", r"\btx\d{0,2}\b"),
+    ("partial_nric", r"\b[stfgm]?\d{1,7}[a-z]?\b"),
+    ("digits", r"\d+"),
+)
+TOKEN_FIRST_CHARS = "stfgm0123456789"
+
+# Match kinds that always contain a digit
+DIGIT_KINDS = frozenset(("nric", "case", "partial_nric", "digits"))
+
+
+def _keywords(words):
+    # Longest first, so e.g. "account number" is not cut short by "account"
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+@dataclass(slots=True)
+class ScanResult:
+    nric: str | None = None
+    case_number: str | None = None
+    bank: str | None = None
+    mentions_nric: bool = False
+    mentions_case: bool = False
+    mentions_bank_account: bool = False
+    has_digits: bool = False
+    partial_nrics: list = field(default_factory=list)
+    partial_cases: list = field(default_factory=list)
+
+    @property
+    def feedback(self):
+        """Warnings for identifiers that look incomplete."""
+        return (
+            [f"⚠️ '{m}' looks like an incomplete NRIC. Format should be: S/T/F/G/M + 7 digits + 1 letter (e.g., S1234567A)"
+             for m in self.partial_nrics]
+            + [f"⚠️ '{m}' looks like an incomplete Case Number. Format should be: TX + 3 digits (e.g., TX001)"
+               for m in self.partial_cases]
+        )
+
+
+class InputScanner:
+    def __init__(self, bank_names=()):
+        self.bank_names = {bank.lower(): bank for bank in bank_names}
+        words = NRIC_KEYWORDS + CASE_KEYWORDS + BANK_ACCOUNT_KEYWORDS + tuple(self.bank_names)
+        first_chars = set(TOKEN_FIRST_CHARS) | {w[0] for w in words}
+
+        groups = [f"(?P<{name}>{pattern})" for name, pattern in TOKEN_PATTERNS]
+        groups += [
+            f"(?P<nric_keyword>{_keywords(NRIC_KEYWORDS)})",
+            f"(?P<case_keyword>{_keywords(CASE_KEYWORDS)})",
+            f"(?P<bank_account_keyword>{_keywords(BANK_ACCOUNT_KEYWORDS)})",
+        ]
+        if self.bank_names:
+            groups.append(f"(?P<bank>{_keywords(self.bank_names)})")
+        first = re.escape("".join(sorted(first_chars)))
+        self.pattern = re.compile(f"(?=[{first}])(?:{'|'.join(groups)})")
+
+    def scan(self, text):
+        result = ScanResult()
+        lowered = text.lower()
+        # Report partial identifiers as typed, unless lowercasing changed the length
+        source = text if len(lowered) == len(text) else lowered
+        for match in self.pattern.finditer(lowered):
+            kind = match.lastgroup
+            if kind in DIGIT_KINDS:
+                result.has_digits = True
+            value = source[match.start():match.end()]
+            if kind in ("partial_case", "bank_account_keyword") and not result.has_digits:
+                result.has_digits = any(c.isdigit() for c in value)
+
+            if kind == "nric":
+                result.nric = result.nric or value.upper()
+            elif kind == "case":
+                result.case_number = result.case_number or value.upper()
+                result.mentions_case = True
+            elif kind == "partial_case":
+                result.partial_cases.append(value)
+                result.mentions_case = True
+            elif kind == "partial_nric":
+                if len(value) > 3:
+                    result.partial_nrics.append(value)
+            elif kind == "nric_keyword":
+                result.mentions_nric = True
+            elif kind == "case_keyword":
+                result.mentions_case = True
+            elif kind == "bank_account_keyword":
+                result.mentions_bank_account = True
+            elif kind == "bank":
+                result.bank = result.bank or self.bank_names[match.group()]
+        return result
@@ -0,0 +1,194 @@
+"""Process-wide gateway for chat completion calls.
+
+Streamlit runs every session's script in its own thread, so a burst of users
+used to mean a burst of unbounded, blocking API calls. The gateway runs an
+AsyncOpenAI client on one background event loop with a shared httpx
+connection pool, and every call goes through the same controls:
+
+- a semaphore capping concurrent requests per process,
+- token buckets for requests and tokens per minute (the org quota),
+- retries with jittered exponential backoff on 429, 5xx and connection errors,
+  honouring Retry-After,
+- a hard deadline per call, covering retries and, when streaming, the whole stream.
+
+``create()`` is the blocking entry point for script threads and takes the
+same arguments as ``client.chat.completions.create``; with ``stream=True`` it
+returns an iterator of chunks.
+
+``open_llm_backend`` picks the backend: the OpenAI API, any OpenAI-compatible
+endpoint (a local llama.cpp or vLLM server, or ``stub_llm.py --port``), or
+the in-process deterministic stub.
+"""
+import asyncio
+import concurrent.futures
+import random
+import threading
+import time
+
+import httpx
+from openai import APIConnectionError, APIStatusError, AsyncOpenAI
+
+from conversation_context import count_message_tokens
+from stub_llm import StubLLM, load_script
+
+
+class LLMDeadlineExceeded(TimeoutError):
+    """The call did not finish within its deadline."""
+
+
+class TokenBucket:
+    """Async token bucket refilled continuously at rate_per_minute; None disables the limit."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0 if rate_per_minute else None
+        self.capacity = capacity or rate_per_minute or 0
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        """Wait until amount tokens are available and take them; returns the seconds waited."""
+        if self.rate is None:
+            return 0.0
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= amount:
+                    self._tokens -= amount
+                    return waited
+                delay = (amount - self._tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+def is_retryable(error):
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIStatusError):
+        if error.status_code == 429:
+            # An exhausted quota will not recover by retrying
+            return getattr(error, "code", None) != "insufficient_quota"
+        return error.status_code >= 500
+    return False
+
+
+class LLMGateway:
+    def __init__(self, api_key=None, base_url=None, max_concurrency=8, requests_per_minute=3500,
+                 tokens_per_minute=200000, max_retries=3, deadline=60.0, base_delay=0.5, max_delay=20.0,
+                 max_connections=20):
+        self.max_retries = max_retries
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = {"calls": 0, "retries": 0, "rate_limited_seconds": 0.0, "deadline_exceeded": 0}
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+        self._thread.start()
+
+        self._http = httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        ))
+        # Retries and timeouts are handled here, so the SDK's own are switched off
+        self.client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self._http,
+                                  max_retries=0, timeout=deadline)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+
+    def create(self, deadline=None, **kwargs):
+        """Blocking chat completion; returns the response, or an iterator of chunks when stream=True."""
+        deadline_at = time.monotonic() + (deadline or self.deadline)
+        if kwargs.get("stream"):
+            return self._iterate(self._astream(kwargs, deadline_at), deadline_at)
+        return self._run(self._acreate(kwargs, deadline_at), deadline_at)
+
+    def close(self):
+        self._run(self._http.aclose(), time.monotonic() + 5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _acreate(self, kwargs, deadline_at):
+        async with self._semaphore:
+            return await self._call_with_retries(kwargs, deadline_at)
+
+    async def _astream(self, kwargs, deadline_at):
+        # The concurrency slot is held until the stream is fully read or closed
+        async with self._semaphore:
+            stream = await self._call_with_retries(kwargs, deadline_at)
+            try:
+                async for chunk in stream:
+                    yield chunk
+            finally:
+                await stream.close()
+
+    async def _call_with_retries(self, kwargs, deadline_at):
+        estimate = count_message_tokens(kwargs.get("messages", []), kwargs.get("model", "gpt-3.5-turbo"))
+        estimate += kwargs.get("max_tokens") or 0
+        for attempt in range(self.max_retries + 1):
+            self.stats["rate_limited_seconds"] += await self._requests.acquire(1)
+            self.stats["rate_limited_seconds"] += await self._tokens.acquire(estimate)
+            self.stats["calls"] += 1
+            try:
+                return await self.client.chat.completions.create(**kwargs)
+            except Exception as e:
+                if not is_retryable(e) or attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                if time.monotonic() + delay >= deadline_at:
+                    raise
+                self.stats["retries"] += 1
+                await asyncio.sleep(delay)
+
+    def _retry_delay(self, error, attempt):
+        """Server-requested Retry-After if present, else exponential backoff with full jitter."""
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            return min(self.max_delay, float(retry_after))
+        except (TypeError, ValueError):
+            return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _run(self, coro, deadline_at):
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(timeout=max(0.0, deadline_at - time.monotonic()))
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self.stats["deadline_exceeded"] += 1
+            raise LLMDeadlineExceeded("The model did not respond before the deadline") from None
+
+    def _iterate(self, stream, deadline_at):
+        async def next_chunk():
+            return await stream.__anext__()
+
+        try:
+            while True:
+                try:
+                    yield self._run(next_chunk(), deadline_at)
+                except StopAsyncIteration:
+                    return
+        finally:
+            asyncio.run_coroutine_threadsafe(stream.aclose(), self._loop)
+
+
+LLM_BACKENDS = ("openai", "openai-compatible", "stub")
+
+
+def open_llm_backend(backend="openai", base_url=None, api_key=None, stub_script=None, **limits):
+    """Open the chat completions backend selected by name; every backend has the same create()."""
+    if backend == "stub":
+        return StubLLM(load_script(stub_script) if stub_script else ())
+    if backend == "openai-compatible":
+        if not base_url:
+            raise ValueError("LLM_BASE_URL must be set for the openai-compatible backend")
+        # Local servers usually ignore the key, but the client requires one
+        return LLMGateway(api_key=api_key or "not-needed", base_url=base_url, **limits)
+    if backend == "openai":
+        return LLMGateway(api_key=api_key, base_url=base_url, **limits)
+    raise ValueError(f"Unknown LLM backend {backend!r}; expected one of {', '.join(LLM_BACKENDS)}")
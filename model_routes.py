@@ -0,0 +1,40 @@
+"""Per-step model settings for the chat completion call.
+
+Most model turns are short clarifications inside the SOP (re-asking a yes/no
+question or which bank holds the funds); the release decision is a small
+structured tool call that must be deterministic. The route table picks the
+model, temperature and max_tokens for the step being handled, so
+clarifications run on the fast model with a small output budget.
+"""
+from dataclasses import dataclass
+
+from sop_flow import BANK_CONFIRM, DECISION, DISCLOSURE, FUND_CHECK, LAST4
+
+# Turns outside an SOP step: general IIT questions and follow-ups after a case is closed
+GENERAL = "general"
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    model: str
+    temperature: float
+    max_tokens: int
+
+
+def build_route_table(model, fast_model=None):
+    """Route table keyed by SOP step; fast_model (default: model) serves the clarification steps."""
+    fast_model = fast_model or model
+    clarification = ModelRoute(fast_model, temperature=0.3, max_tokens=200)
+    return {
+        GENERAL: ModelRoute(model, temperature=0.7, max_tokens=600),
+        DISCLOSURE: clarification,
+        FUND_CHECK: clarification,
+        BANK_CONFIRM: clarification,
+        LAST4: clarification,
+        # The decision is a small structured tool call; the summary is rendered locally from it
+        DECISION: ModelRoute(model, temperature=0.0, max_tokens=200),
+    }
+
+
+def route_for(table, step):
+    return table.get(step, table[GENERAL])
@@ -130,21 +130,29 @@ st.subheader("🔍 Technical Implementation Details")
 
 st.markdown("""
 ### NRIC & Case Number Detection
-- **Regex Pattern for NRIC**: `\b[STFG]\d{7}[A-Z]\b` (e.g., S1111111A)
+- **Regex Pattern for NRIC**: `\b[STFGM]\d{7}[A-Z]\b` (e.g., S1111111A)
+- **NRIC/FIN Check Letter**: verified with the S/T/F/G/M checksum weights; unknown NRIC and Case Number pairs are rejected from an in-memory index before any record load or AI call
 - **Regex Pattern for Case Number**: `\bTX\d{3}\b'` (case-insensitive, e.g., tx001, TX001)
 - Extraction happens in real-time as user types
 
 ### Tax Records Loading
+The records are opened once per process into a shared store, indexed by (NRIC, Case_Number), instead of
+re-reading the CSV on every message. `TAX_RECORDS_PATH` selects the CSV, a memory-mapped snapshot built with
+`tax_snapshot.py` or a SQLite database built with `sqlite_store.py`; all three answer the same lookups.
 ```python
+@st.cache_resource
+def get_record_store():
+    return open_record_store(TAX_RECORDS_PATH, TAX_RECORDS_BACKEND)
+
 def load_tax_records(nric, case_number):
-    df = pd.read_csv("data/tax_records.csv")
-    filtered_df = df[(df['NRIC'] == nric) &
-                     (df['Case_Number'] == case_number)]
-    return filtered_df
+    store = get_record_store()
+    store.refresh()  # cheap stat() check; only new or changed rows are re-read
+    records = store.get_records(nric, case_number)  # one index lookup, None if unknown
+    return None if records is None else records.drop(['NRIC', 'Case_Number'], axis=1)
 ```
 
 ### Session State Management
-- `st.session_state.messages`: Stores chat history
+- `st.session_state.messages`: Stores chat history; each message has an ID, and only the latest `CHAT_HISTORY_WINDOW` messages are drawn (older ones are paged in on request)
 - `st.session_state.nric`: Current user NRIC
 - `st.session_state.case_number`: Current case number
 - `st.session_state.tax_records`: Loaded tax data (DataFrame)
@@ -171,7 +179,7 @@ The system guides the user through a structured 4-step process:
 
 ### Key Features:
 - **4-Step SOP Workflow**: Structured process following IRAS procedures
-- **Approval Criteria Validation**: AI evaluates all conditions before approving
+- **Approval Criteria Validation**: AI records its decision through a tool call, checked against the verified facts
 - **Automated Email Notification**: Sends release notice to appointed bank
 - **Real-time Portal Updates**: Displays "In Progress" status when approved
 """)
@@ -238,53 +246,38 @@ st.markdown("""
 3. ✓ Bank matches appointed bank
 4. ✓ All required information provided (NRIC, Case Number, Bank Details, Account Number)
 
-### AI Summary Generation
-The AI generates a structured summary in this format:
+### Release Decision Tool Call
+Once all information is collected, the AI is called with `tools=[RELEASE_DECISION_TOOL]` and a forced
+`tool_choice`, and must return a `record_release_decision` call:
 ```
-Your request for bank appointment release is [APPROVED/REJECTED]
-REASON: [Explanation]
-
-CASE DETAILS:
-- NRIC: [value]
-- Case Number: [value]
-- Year of Assessment: [value]
-
-BANK APPOINTMENT INFORMATION:
-- Appointed Bank: [value]
-- Appointment Amount: S$[value]
-- Appointment Date: [value]
-
-TAX LIABILITY STATUS:
-- Total Payable: S$[value]
-- Total Paid: S$[value]
-- Current Balance: S$[value]
-
-FUND AVAILABILITY:
-- User confirmed: [YES/NO]
-
-VERIFICATION:
-- Bank Account Confirmed: [value]
-- Account Details: [last 4 digits]
-
-BANK_APPOINTMENT_RELEASE_APPROVED
-[If approved, includes this exact keyword]
+{
+  "decision": "APPROVED" | "REJECTED",
+  "reason": "One sentence explaining the decision",
+  "fund_available": true | false,
+  "bank_confirmed": "[bank]",
+  "account_last4": "[last 4 digits]"
+}
 ```
 
-### Approval Detection
+### Decision Verification
 ```python
-if "BANK_APPOINTMENT_RELEASE_APPROVED" in full_response:
-    st.session_state.bank_appointment_release_approved = True
-    # Trigger email sending
-    send_bank_release_email(...)
+decision = parse_release_decision(response)
+verified = verified_decision(st.session_state.sop_state, summary, decision)
+full_response = render_decision_summary(verified, summary, nric, case_number)
+if verified.approved:
+    queue_bank_release_email(render_release_details(verified, summary), ...)
 ```
+- The outcome and the fund, bank and account fields come from the facts the SOP verified locally, not from the tool call
+- The summary shown to the user (case details, bank appointment, tax liability, fund availability, verification) is rendered from a template
+- Chat replies never approve or reject a release; only the tool call can
 
 ### Email Automation
 When approved, the system:
-1. Extracts Bank Appointment Information, Fund Availability, and Verification sections from summary
+1. Renders the Bank Appointment Information, Fund Availability and Verification sections from the verified decision
 2. Generates professional email to appointed bank
-3. Sends via Gmail SMTP with App Password
-4. Maps bank name to email address using BANK_EMAIL_MAPPING
-5. Confirms delivery to user
+3. Maps bank name to email address using BANK_EMAIL_MAPPING
+4. Queues the notice in the outbox, which a background sender delivers via SMTP
+5. Confirms to the user that the notice is queued
 
 ### Email Template Structure
 - **Document Information**: Reference number, date, time
@@ -0,0 +1,42 @@
+"""Display frame for the Tax Assessment Records table in My Tax Portal.
+
+The table used to be rebuilt on every rerun: a copy of the records, four
+row-wise ``.apply(lambda x: f"{x:.2f}")`` passes materialising the amounts as
+strings, then drops, a reorder and a rename. ``format_records_table`` does
+one column selection and rename and leaves the amounts numeric; the
+two-decimal display comes from ``MONEY_FORMAT`` in the dataframe's column
+config, so no strings are built. The app caches the result per
+(NRIC, Case_Number, store version).
+"""
+import pandas as pd
+
+# Source column -> display name, in display order
+DISPLAY_COLUMNS = {
+    "Date": "Date",
+    "Description": "Description",
+    "Year_of_Assessment": "Year of Assessment",
+    "Payable": "Payable (S$)",
+    "Paid": "Paid (S$)",
+    "Balance": "Balance (S$)",
+    "Bank_Appointment_Date": "Bank Appt Date",
+    "Appointed_Bank": "Appointed Bank",
+    "Appointment_Amount": "Appointment Amount (S$)",
+}
+MONEY_COLUMNS = ("Payable", "Paid", "Balance", "Appointment_Amount")
+MONEY_FORMAT = "%.2f"
+
+
+def money_display_columns(columns):
+    """Display names of the amount columns present in a formatted table."""
+    return [DISPLAY_COLUMNS[c] for c in MONEY_COLUMNS if DISPLAY_COLUMNS[c] in columns]
+
+
+def format_records_table(records):
+    """Select, order and rename the displayed columns; amounts stay numeric (blank amounts become NaN)."""
+    columns = [c for c in DISPLAY_COLUMNS if c in records.columns]
+    table = records[columns].rename(columns=DISPLAY_COLUMNS)
+    for column in MONEY_COLUMNS:
+        name = DISPLAY_COLUMNS[column]
+        if name in table.columns and not pd.api.types.is_float_dtype(table[name]):
+            table[name] = pd.to_numeric(table[name], errors="coerce")
+    return table.reset_index(drop=True)
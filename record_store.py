@@ -0,0 +1,211 @@
+import io
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from case_summary import case_summaries, summarize_case, summarize_cases
+from sqlite_store import SqliteRecordStore
+from tax_snapshot import TaxSnapshot
+
+KEY_COLUMNS = ["NRIC", "Case_Number"]
+
+# Number of bytes just before the last consumed offset that must be unchanged
+# for a grown file to be treated as an append rather than a rewrite.
+TAIL_GUARD_BYTES = 64
+
+
+class TaxRecordStore:
+    """Process-wide tax record store, indexed by (NRIC, Case_Number).
+
+    The CSV is parsed once and every row position is grouped under its
+    (NRIC, Case_Number) key, so a lookup is a dict hit plus an ``iloc``
+    instead of a full parse and boolean scan of the file.
+
+    ``refresh()`` keeps the store in step with the file: it compares the
+    file's inode, size and mtime against the last load and does nothing if
+    they match. In tail mode (the default), a file that only grew on the same
+    inode is treated as an append and only the new rows are parsed and merged
+    into the index; any other change falls back to a full reload.
+
+    A CaseSummary per case is materialised alongside the index at load time;
+    appends only re-summarise the cases they touched.
+    """
+
+    def __init__(self, path, tail=True):
+        self.path = path
+        self.tail = tail
+        self.version = 0
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._df = None
+        self._index = {}
+        self._nrics = set()
+        self._summaries = {}
+        self._signature = None
+        self._offset = 0
+        self._guard = b""
+        self.load()
+
+    def load(self):
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            data = f.read()
+
+        df = pd.read_csv(io.BytesIO(data))
+        index = df.groupby(KEY_COLUMNS, sort=False).indices
+        summaries = case_summaries(summarize_cases(df))
+
+        with self._lock:
+            self._df = df
+            self._index = index
+            self._nrics = {nric for nric, _ in index}
+            self._summaries = summaries
+            self._set_position(stat, data, len(data))
+            self.version += 1
+
+    def refresh(self):
+        """Reload whatever changed on disk; returns True if the store changed."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        if self._file_signature(stat) == self._signature:
+            return False
+
+        with self._reload_lock:
+            stat = os.stat(self.path)
+            if self._file_signature(stat) == self._signature:
+                return False
+            if self.tail:
+                appended = self._append_tail()
+                if appended is not None:
+                    return appended
+            self.load()
+            return True
+
+    def get_records(self, nric, case_number):
+        """Return the ledger rows for a case in file order, or None if unknown."""
+        with self._lock:
+            positions = self._index.get((nric, case_number))
+            if positions is None:
+                return None
+            return self._df.iloc[positions]
+
+    def get_summary(self, nric, case_number):
+        """Return the precomputed CaseSummary for a case, or None if unknown."""
+        with self._lock:
+            return self._summaries.get((nric, case_number))
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._index
+
+    def has_nric(self, nric):
+        """Whether any case is on file for nric."""
+        with self._lock:
+            return nric in self._nrics
+
+    def case_keys(self):
+        """All (NRIC, Case_Number) keys."""
+        with self._lock:
+            return list(self._index)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._df)
+
+    def _append_tail(self):
+        """Parse only the bytes appended since the last load.
+
+        Returns True when new rows were merged, False when only a partial
+        line has been appended so far (nothing changes, and the same bytes
+        are looked at again on the next refresh), and None when the file
+        cannot safely be treated as append-only (different inode, shrunk or
+        rewritten in place, the bytes before the old offset changed, or the
+        old last row itself was extended) and needs a full reload.
+        """
+        with open(self.path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if self._signature is None or stat.st_ino != self._signature[0] or stat.st_size <= self._offset:
+                return None
+
+            f.seek(self._offset - len(self._guard))
+            if f.read(len(self._guard)) != self._guard:
+                return None
+            tail = f.read()
+
+        # A last row loaded without its newline may only be followed by that newline
+        start = 0
+        if self._guard and not self._guard.endswith(b"\n"):
+            if not tail.startswith(b"\n"):
+                return None
+            start = 1
+
+        # Leave a half-written last line for the next refresh
+        consumed = tail.rfind(b"\n") + 1
+        if consumed <= start:
+            return False
+
+        chunk = pd.read_csv(io.BytesIO(tail[start:consumed]), header=None, names=self._df.columns)
+        base = len(self._df)
+        merged = pd.concat([self._df, chunk], ignore_index=True)
+
+        index_updates = {}
+        summary_updates = {}
+        for key, positions in chunk.groupby(KEY_COLUMNS, sort=False).indices.items():
+            positions = positions + base
+            existing = self._index.get(key)
+            positions = positions if existing is None else np.concatenate([existing, positions])
+            index_updates[key] = positions
+            summary_updates[key] = summarize_case(merged.iloc[positions])
+
+        with self._lock:
+            self._df = merged
+            self._index.update(index_updates)
+            self._nrics.update(nric for nric, _ in index_updates)
+            self._summaries.update(summary_updates)
+            self._set_position(stat, self._guard + tail, len(self._guard) + consumed, self._offset + consumed)
+            self.version += 1
+        return True
+
+    def _set_position(self, stat, data, end, offset=None):
+        self._signature = self._file_signature(stat)
+        self._offset = end if offset is None else offset
+        self._guard = data[max(0, end - TAIL_GUARD_BYTES):end]
+
+    @staticmethod
+    def _file_signature(stat):
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+def open_record_store(path, backend=None):
+    """Open the record store backend for path.
+
+    Every backend answers ``get_records(nric, case_number)`` with the case's
+    rows as a DataFrame (or None) and ``get_summary(nric, case_number)`` with
+    its CaseSummary (or None), and supports ``refresh()``, ``version``,
+    ``in`` on (NRIC, Case_Number) keys, ``has_nric(nric)``, ``case_keys()``
+    and ``len()``. Without an explicit
+    backend name it is inferred from path: a directory is a snapshot, a
+    ``.db``/``.sqlite`` file is SQLite, anything else is CSV.
+    """
+    if backend is None:
+        if os.path.isdir(path):
+            backend = "snapshot"
+        elif path.endswith((".db", ".sqlite", ".sqlite3")):
+            backend = "sqlite"
+        else:
+            backend = "csv"
+
+    if backend not in RECORD_BACKENDS:
+        raise ValueError(f"Unknown tax records backend '{backend}'. Expected one of: {', '.join(RECORD_BACKENDS)}")
+    return RECORD_BACKENDS[backend](path)
+
+
+RECORD_BACKENDS = {
+    "csv": TaxRecordStore,
+    "snapshot": TaxSnapshot,
+    "sqlite": SqliteRecordStore,
+}
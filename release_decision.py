@@ -0,0 +1,71 @@
+"""Structured release decision for the SOP decision turn.
+
+Instead of writing the free-text summary and the approval marker, the model
+is forced to call ``record_release_decision`` with typed arguments. The
+summary shown to the user and the bank notice are then rendered locally from
+these fields and the case summary, so nothing is re-parsed from model text.
+"""
+import json
+import re
+from dataclasses import dataclass
+
+RELEASE_DECISION_FUNCTION = "record_release_decision"
+
+RELEASE_DECISION_TOOL = {
+    "type": "function",
+    "function": {
+        "name": RELEASE_DECISION_FUNCTION,
+        "description": "Record the bank appointment release determination (SOP Step 4).",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "decision": {"type": "string", "enum": ["APPROVED", "REJECTED"]},
+                "reason": {"type": "string", "description": "One sentence explaining the decision."},
+                "fund_available": {"type": "boolean", "description": "The user confirmed the full amount is available."},
+                "bank_confirmed": {"type": "string", "description": "The bank the user confirmed holds the funds."},
+                "account_last4": {"type": "string", "description": "Last 4 digits of that account, or empty."},
+            },
+            "required": ["decision", "reason", "fund_available", "bank_confirmed", "account_last4"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+RELEASE_DECISION_TOOL_CHOICE = {"type": "function", "function": {"name": RELEASE_DECISION_FUNCTION}}
+
+
+@dataclass(frozen=True)
+class ReleaseDecision:
+    decision: str
+    reason: str
+    fund_available: bool
+    bank_confirmed: str
+    account_last4: str
+
+    @property
+    def approved(self):
+        return self.decision == "APPROVED"
+
+
+def parse_release_decision(response):
+    """Read the decision from a completion's tool call; None if the model did not make a valid one."""
+    message = response.choices[0].message if response.choices else None
+    for call in (getattr(message, "tool_calls", None) or []):
+        if call.function.name != RELEASE_DECISION_FUNCTION:
+            continue
+        try:
+            args = json.loads(call.function.arguments)
+        except (TypeError, ValueError):
+            return None
+        decision = str(args.get("decision", "")).upper()
+        if decision not in ("APPROVED", "REJECTED"):
+            return None
+        last4 = str(args.get("account_last4") or "")
+        return ReleaseDecision(
+            decision=decision,
+            reason=str(args.get("reason") or "").strip(),
+            fund_available=bool(args.get("fund_available")),
+            bank_confirmed=str(args.get("bank_confirmed") or "").strip(),
+            account_last4=last4 if re.fullmatch(r"\d{4}", last4) else "",
+        )
+    return None
@@ -0,0 +1,119 @@
+"""Response cache for general IIT questions.
+
+Questions such as "when is filing due" or "how does GIRO work" get the same
+answer for everyone, so they are served from a small in-process cache keyed
+on the normalised question text instead of calling the model again. Entries
+expire after a TTL and the least recently used entry is evicted when full.
+
+Only general questions are cached: the caller must bypass the cache once the
+session holds an NRIC, case number or tax records, and ``cache_key`` refuses
+any question that itself looks like it contains personal data. A reply also
+depends on the conversation before the question, so the key includes a hash
+of the earlier messages: only the same question after the same conversation
+(in practice, an opening question) is served from the cache.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Identifiers, account digits, emails and phone numbers make a question personal
+PERSONAL_DATA_PATTERN = re.compile(
+    r'[STFGM]\d{7}[A-Z]'
+    r'|\bTX\d+'
+    r'|\d{4,}'
+    r'|[\w.+-]+@[\w-]+\.[\w.]+'
+    r'|\+?\d[\d\s-]{6,}\d',
+    re.IGNORECASE
+)
+
+# Greetings and politeness that do not change the answer
+FILLER_PATTERN = re.compile(r"\b(hi|hello|hey|please|pls|kindly|thanks|thank you|um|uh)\b")
+
+# Very short turns are usually follow-ups that only make sense with the conversation
+MIN_QUESTION_WORDS = 3
+
+
+def normalize_question(text):
+    """Lowercase, drop punctuation, filler words and extra whitespace."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    text = FILLER_PATTERN.sub(" ", text)
+    return " ".join(text.split())
+
+
+def conversation_hash(messages):
+    """Hash of the role and content of earlier chat messages; stable across sessions."""
+    payload = json.dumps([(m["role"], m["content"]) for m in messages], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def cache_key(question, *scope):
+    """Cache key for a general question, or None if it should not be cached.
+
+    ``scope`` (e.g. the system prompt hash, model and ``conversation_hash`` of
+    the earlier messages) is part of the key, so changing the prompt, model or
+    preceding conversation never serves an answer produced for another.
+    """
+    if PERSONAL_DATA_PATTERN.search(question):
+        return None
+    normalized = normalize_question(question)
+    if len(normalized.split()) < MIN_QUESTION_WORDS:
+        return None
+    return (*scope, normalized)
+
+
+class ResponseCache:
+    """Thread-safe TTL + LRU cache of model replies with hit-rate metrics."""
+
+    def __init__(self, max_entries=500, ttl=3600.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "bypasses": 0, "expired": 0, "evictions": 0}
+
+    def get(self, key):
+        if key is None:
+            self.record_bypass()
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._clock() - entry[1] > self.ttl:
+                del self._entries[key]
+                self._stats["expired"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key, response):
+        if key is None or self.max_entries <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (response, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def record_bypass(self):
+        """Count a turn that skipped the cache because it involves personal data."""
+        with self._lock:
+            self._stats["bypasses"] += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(
+                self._stats,
+                entries=len(self._entries),
+                hit_rate=self._stats["hits"] / lookups if lookups else 0.0
+            )
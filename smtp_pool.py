@@ -0,0 +1,157 @@
+"""Pooled, persistent SMTP sessions for release notice delivery.
+
+Opening a session costs a TCP connect, a TLS handshake and AUTH. The pool
+keeps authenticated sessions open between sends, checks idle ones with NOOP
+before reuse and reconnects transparently when the server has dropped them.
+``deliver_batch`` sends a batch of queued notices grouped by recipient and
+bank, over one session per group or as a single digest email per group.
+"""
+import queue
+import smtplib
+import threading
+import time
+from contextlib import contextmanager
+from itertools import groupby
+
+from bank_notifications import build_digest_email, open_smtp_session, to_mime
+
+# Failures that mean the session itself is broken (rather than one message being refused)
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+BATCH_MODES = ("none", "session", "digest")
+
+
+class SMTPConnectionPool:
+    def __init__(self, settings, size=2, health_check_after=30.0, idle_timeout=240.0, connect=open_smtp_session):
+        self.settings = settings
+        self.health_check_after = health_check_after
+        self.idle_timeout = idle_timeout
+        self._connect = connect
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self.stats = {"connects": 0, "reuses": 0, "health_checks": 0, "reconnects": 0}
+
+    @contextmanager
+    def connection(self):
+        """Check out a live session; it goes back to the pool unless it broke while in use."""
+        self._slots.acquire()
+        server = None
+        try:
+            server = self._checkout()
+            yield server
+        except CONNECTION_ERRORS:
+            self._discard(server)
+            server = None
+            raise
+        finally:
+            if server is not None:
+                self._idle.put((server, time.monotonic()))
+            self._slots.release()
+
+    def send(self, email):
+        """Send one notice, reconnecting once if the pooled session turns out to be dead."""
+        for attempt in range(2):
+            try:
+                with self.connection() as server:
+                    server.send_message(to_mime(email))
+                return
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                if attempt:
+                    raise
+                self.stats["reconnects"] += 1
+
+    def close(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._quit(server)
+
+    def _checkout(self):
+        while True:
+            try:
+                server, idle_since = self._idle.get_nowait()
+            except queue.Empty:
+                self.stats["connects"] += 1
+                return self._connect(self.settings)
+
+            idle = time.monotonic() - idle_since
+            if idle > self.idle_timeout:
+                self._quit(server)
+                continue
+            if idle > self.health_check_after:
+                self.stats["health_checks"] += 1
+                try:
+                    code, _ = server.noop()
+                except OSError:
+                    code = None
+                if code != 250:
+                    self._discard(server)
+                    continue
+            self.stats["reuses"] += 1
+            return server
+
+    def _discard(self, server):
+        if server is not None:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _quit(self, server):
+        try:
+            server.quit()
+        except Exception:
+            self._discard(server)
+
+
+def deliver_batch(pool, emails, mode="session"):
+    """Deliver a batch of notices through the pool.
+
+    ``session`` sends each bank's notices back to back on one session,
+    ``digest`` combines them into a single email per bank, and ``none`` sends
+    every notice on its own checkout. Returns {reference: exception or None}.
+
+    Notices are grouped by (recipient, bank), not recipient alone: several
+    banks may share an address, and a digest is labelled with one bank.
+    """
+    if mode not in BATCH_MODES:
+        raise ValueError(f"Unknown batch mode '{mode}'. Expected one of: {', '.join(BATCH_MODES)}")
+    results = {}
+    if mode == "none":
+        for email in emails:
+            try:
+                pool.send(email)
+                results[email["reference"]] = None
+            except Exception as e:
+                results[email["reference"]] = e
+        return results
+
+    by_recipient_bank = lambda email: (email["recipient"], email.get("bank") or "")
+    for _, group in groupby(sorted(emails, key=by_recipient_bank), key=by_recipient_bank):
+        group = list(group)
+        if mode == "digest" and len(group) > 1:
+            try:
+                pool.send(build_digest_email(group))
+                error = None
+            except Exception as e:
+                error = e
+            results.update({email["reference"]: error for email in group})
+            continue
+
+        pending = list(group)
+        try:
+            with pool.connection() as server:
+                while pending:
+                    email = pending[0]
+                    try:
+                        server.send_message(to_mime(email))
+                        results[email["reference"]] = None
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                        results[email["reference"]] = e
+                    pending.pop(0)
+        except Exception as e:
+            # The session broke: fail what was not sent, for the outbox to retry
+            results.update({email["reference"]: e for email in pending})
+    return results
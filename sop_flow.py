@@ -0,0 +1,236 @@
+"""State machine for the IIT bank appointment release SOP.
+
+The release flow runs verification -> disclosure -> fund check -> bank
+confirmation -> last 4 digits -> decision. Each user turn is first offered to
+``advance()``, which resolves yes/no answers, bank names and account digits
+with local parsers and answers with a templated reply. Only turns the parsers
+cannot resolve, and the final release decision, go to the model, together
+with a short instruction for the current step.
+"""
+import re
+from dataclasses import dataclass
+
+from release_decision import ReleaseDecision
+from sop_templates import (
+    render_bank_mismatch,
+    render_bank_question,
+    render_declined,
+    render_disclosure,
+    render_fund_check,
+    render_insufficient_funds,
+    render_last4_question,
+    render_last4_reprompt,
+)
+
+VERIFICATION = "verification"
+DISCLOSURE = "disclosure"
+FUND_CHECK = "fund_check"
+BANK_CONFIRM = "bank_confirm"
+LAST4 = "last4"
+DECISION = "decision"
+COMPLETED = "completed"
+CLOSED = "closed"
+
+# Only unambiguous answers; "ok" and "sure" often just acknowledge the question ("OK, but ...")
+YES_WORDS = {"yes", "y", "yeah", "yep", "yup", "correct", "confirm", "confirmed", "proceed"}
+NO_WORDS = {"no", "n", "nope", "not", "don't", "dont", "haven't", "havent", "insufficient", "cannot", "can't"}
+# Qualified or idiomatic replies that are not a plain yes or no ("yes, but only part", "no problem", "not sure")
+HEDGE_PATTERN = re.compile(
+    r"\b(but|only|partly|partially|part|some|maybe|perhaps|unsure)\b"
+    r"|\bno (problem|worries|issue|idea)\b"
+    r"|\bnot (sure|certain|yet)\b"
+)
+
+LAST_FOUR_PATTERN = re.compile(r'(?<!\d)\d{4}(?!\d)')
+
+
+@dataclass
+class SopState:
+    step: str = VERIFICATION
+    nric: str = ""
+    case_number: str = ""
+    fund_available: bool | None = None
+    bank_confirmed: str | None = None
+    bank_mismatches: int = 0
+    account_last4: str | None = None
+    decision: str | None = None
+
+    @property
+    def facts(self):
+        return {
+            "fund_available": self.fund_available,
+            "bank_confirmed": self.bank_confirmed,
+            "account_last4": self.account_last4,
+        }
+
+    def is_case(self, nric, case_number):
+        return (self.nric, self.case_number) == (nric, case_number)
+
+
+@dataclass(frozen=True)
+class TurnAction:
+    """What to do with a user turn: reply locally, or ask the model with an instruction."""
+    reply: str | None = None
+    instruction: str | None = None
+
+
+def parse_yes_no(text):
+    """Return True for an affirmative reply, False for a negative one, None if unclear.
+
+    Only a reply of a single polarity counts: a qualified or mixed reply
+    ("Yes, but not all of it", "No problem, I have it", "Not sure") is
+    unclear, and the step asks again rather than recording an answer that
+    releases or closes the case.
+    """
+    text = text.lower()
+    words = re.findall(r"[a-z']+", text)
+    if not words or "?" in text or HEDGE_PATTERN.search(text):
+        return None
+    affirmative = any(w in YES_WORDS for w in words)
+    negative = any(w in NO_WORDS for w in words)
+    if affirmative == negative:
+        return None
+    return affirmative
+
+
+def parse_bank(text, bank_names):
+    text_upper = text.upper()
+    for bank in bank_names:
+        if re.search(rf'\b{re.escape(bank.upper())}\b', text_upper):
+            return bank
+    return None
+
+
+def parse_last4(text):
+    match = LAST_FOUR_PATTERN.search(text)
+    return match.group(0) if match else None
+
+
+def expected_decision(state, summary):
+    """APPROVED only if funds are confirmed and the confirmed bank is the appointed bank."""
+    bank_matches = bool(state.bank_confirmed) and state.bank_confirmed == summary.appointed_bank
+    return "APPROVED" if state.fund_available and bank_matches and state.account_last4 else "REJECTED"
+
+
+def rejection_reason(state, summary):
+    """One-sentence reason for a REJECTED outcome, from the verified facts."""
+    if not state.fund_available:
+        return "The full appointment amount was not confirmed as available."
+    if state.bank_confirmed != summary.appointed_bank:
+        return (f"The confirmed bank ({state.bank_confirmed or 'not provided'}) is not the appointed bank "
+                f"({summary.appointed_bank}).")
+    return "The last 4 digits of the account were not provided."
+
+
+def verified_decision(state, summary, decision):
+    """The release decision as the verified facts allow it.
+
+    The outcome and the fund, bank and account fields come from ``state``,
+    never from the model's tool call, so a model that approves against the
+    facts cannot release the appointment or pick the recipient bank. The
+    model's reason is kept only when its decision agrees with the facts.
+    """
+    expected = expected_decision(state, summary)
+    if decision.decision == expected and decision.reason:
+        reason = decision.reason
+    else:
+        reason = "All checks passed." if expected == "APPROVED" else rejection_reason(state, summary)
+    return ReleaseDecision(
+        decision=expected,
+        reason=reason,
+        fund_available=bool(state.fund_available),
+        bank_confirmed=state.bank_confirmed or "",
+        account_last4=state.account_last4 or "",
+    )
+
+
+def start_case(nric, case_number, summary):
+    """Start the flow for a newly identified case by disclosing its details (SOP Step 1).
+
+    Returns the new SopState and the disclosure action.
+    """
+    state = SopState(nric=nric, case_number=case_number)
+    state.step = DISCLOSURE if summary.has_appointment else CLOSED
+    return state, TurnAction(reply=render_disclosure(summary))
+
+
+def advance(state, user_input, summary, bank_names):
+    """Move the flow on by one user turn."""
+    if state.step == DISCLOSURE:
+        answer = parse_yes_no(user_input)
+        if answer:
+            state.step = FUND_CHECK
+            return TurnAction(reply=render_fund_check(summary))
+        if answer is False:
+            state.step = CLOSED
+            return TurnAction(reply=render_declined())
+
+    elif state.step == FUND_CHECK:
+        answer = parse_yes_no(user_input)
+        if answer:
+            state.fund_available = True
+            state.step = BANK_CONFIRM
+            return TurnAction(reply=render_bank_question())
+        if answer is False:
+            state.fund_available = False
+            state.decision = "REJECTED"
+            state.step = CLOSED
+            return TurnAction(reply=render_insufficient_funds())
+
+    elif state.step == BANK_CONFIRM:
+        banks = list(dict.fromkeys([summary.appointed_bank, *bank_names]))
+        bank = parse_bank(user_input, [b for b in banks if b])
+        if bank and bank == summary.appointed_bank:
+            state.bank_confirmed = bank
+            state.step = LAST4
+            return TurnAction(reply=render_last4_question(bank))
+        if bank:
+            state.bank_mismatches += 1
+            if state.bank_mismatches == 1:
+                return TurnAction(reply=render_bank_mismatch(bank, summary))
+            # Still a different bank after clarification: decide (rejected) now
+            state.bank_confirmed = bank
+            state.step = DECISION
+
+    elif state.step == LAST4:
+        digits = parse_last4(user_input)
+        if not digits:
+            return TurnAction(reply=render_last4_reprompt())
+        state.account_last4 = digits
+        state.step = DECISION
+
+    return TurnAction(instruction=step_instruction(state, summary))
+
+
+def step_instruction(state, summary):
+    """Narrow instruction for the model when it has to handle the current step."""
+    if state.step == DISCLOSURE:
+        return ("CURRENT SOP STEP: 1 (disclosure already given). The user was asked whether they would like "
+                "to proceed with the bank appointment release process. Briefly address their message, then ask "
+                "again whether they would like to proceed.")
+    if state.step == FUND_CHECK:
+        return ("CURRENT SOP STEP: 2 (fund availability). Briefly address the user's message, then ask again "
+                "whether they currently have the full appointment amount available in their "
+                f"{summary.appointed_bank} account. Do not move to the next step until they answer YES or NO.")
+    if state.step == BANK_CONFIRM:
+        return ("CURRENT SOP STEP: 3 (bank account confirmation). Ask the user which bank holds the account "
+                "with the full funds. Do not ask for anything else yet.")
+    if state.step == DECISION:
+        fund = "YES" if state.fund_available else "NO"
+        return f"""CURRENT SOP STEP: 4 (release determination). All information has been collected:
+- Fund availability confirmed: {fund}
+- Bank account confirmed: {state.bank_confirmed} (appointed bank: {summary.appointed_bank})
+- Account last 4 digits: {state.account_last4 or 'Not provided'}
+Based on these facts the expected outcome is {expected_decision(state, summary)}.
+Record the decision now by calling record_release_decision with the decision, a one-sentence reason
+and these verified fields. The summary for the user is produced from that call; do not write it yourself."""
+    return None
+
+
+def record_decision(state, decision):
+    """Close the flow with a decision from ``verified_decision``."""
+    if state.step != DECISION:
+        return False
+    state.decision = decision.decision
+    state.step = COMPLETED
+    return True
@@ -0,0 +1,167 @@
+"""Templated SOP replies that are fully determined by the tax records.
+
+The disclosure, the fund availability question and the other fixed SOP
+prompts never need the model: every value comes from the case summary or the
+SOP text, so rendering them locally is instant and cannot misstate an amount.
+"""
+from string import Template
+
+NO_APPOINTMENT_TEMPLATE = Template(
+    "Hello! Thank you for providing your NRIC and case number. I've retrieved your tax information.\n\n"
+    "I can see that you currently have no active bank appointment on your account. "
+    "Therefore, the bank appointment release process cannot proceed.\n\n"
+    "However, I can still assist you with other Individual Income Tax (IIT) enquiries. How may I help you?"
+)
+
+DISCLOSURE_TEMPLATE = Template(
+    "Hello! Thank you for providing your NRIC and case number. I've retrieved your tax information.\n\n"
+    "I can see you have a bank appointment with $bank for $amount made on $date for YA $ya.\n\n"
+    "Your total tax liability for YA $ya is $total_payable, and your current outstanding balance is $balance.\n\n"
+    "Would you like to proceed with the bank appointment release process?"
+)
+
+FUND_CHECK_TEMPLATE = Template(
+    "Do you currently have the full appointment amount of $amount available in your $bank account?"
+)
+
+BANK_QUESTION = "Thank you for confirming. Please confirm the bank account that contains the full funds. Which bank is this account with?"
+
+BANK_MISMATCH_TEMPLATE = Template(
+    "The bank you mentioned ($bank) does not match the appointed bank for this case ($appointed_bank). "
+    "Could you please clarify which bank holds the account with the full appointment amount?"
+)
+
+LAST4_QUESTION_TEMPLATE = Template(
+    "Thank you. For verification, please provide the last 4 digits of your $bank account number."
+)
+
+LAST4_REPROMPT = "I need exactly the last 4 digits of the account number for verification. Could you please provide them?"
+
+INSUFFICIENT_FUNDS = (
+    "We are unable to proceed with the bank appointment release as the full appointment amount is not available in your account.\n\n"
+    "To explore alternative payment arrangements, please provide your contact number or email. "
+    "An IRAS officer will contact you within three working days."
+)
+
+DECLINED = (
+    "Understood. The bank appointment release process will not proceed.\n\n"
+    "I can still assist you with other Individual Income Tax (IIT) enquiries. How may I help you?"
+)
+
+RELEASE_DETAILS_TEMPLATE = Template(
+    "BANK APPOINTMENT INFORMATION:\n"
+    "- Appointed Bank: $bank\n"
+    "- Appointment Amount: $amount\n"
+    "- Appointment Date: $date\n\n"
+    "TAX LIABILITY STATUS:\n"
+    "- Total Payable: $total_payable\n"
+    "- Total Paid: $total_paid\n"
+    "- Current Balance: $balance\n\n"
+    "FUND AVAILABILITY:\n"
+    "- User confirmed: $fund\n\n"
+    "VERIFICATION:\n"
+    "- Bank Account Confirmed: $bank_confirmed\n"
+    "- Account Details: $last4"
+)
+
+DECISION_SUMMARY_TEMPLATE = Template(
+    "Thank you for your cooperation.\n"
+    "Your request for bank appointment release is $decision\n"
+    "REASON: $reason\n\n"
+    "Let me provide a summary of this case:\n\n"
+    "CASE DETAILS:\n"
+    "- NRIC: $nric\n"
+    "- Case Number: $case_number\n"
+    "- Year of Assessment: $ya\n\n"
+    "$details\n\n"
+    "$next_steps"
+)
+
+APPROVED_NEXT_STEPS_TEMPLATE = Template(
+    "IRAS will send an official notification to $bank to release the bank appointment. "
+    "You will be notified once the process is complete."
+)
+
+REJECTED_NEXT_STEPS_TEMPLATE = Template(
+    "To proceed, please make sure the full appointment amount of $amount is available in your $bank account "
+    "(the appointed bank), then start the bank appointment release process again."
+)
+
+
+def _money(amount):
+    return "N/A" if amount is None else f"S${amount:.2f}"
+
+
+def _values(summary):
+    return {
+        "bank": summary.appointed_bank or "N/A",
+        "amount": _money(summary.appointment_amount),
+        "date": summary.appointment_date,
+        "ya": summary.year_of_assessment,
+        "total_payable": _money(summary.total_payable),
+        "total_paid": _money(summary.total_paid),
+        "balance": _money(summary.current_balance),
+    }
+
+
+def render_disclosure(summary):
+    """SOP Step 1: disclose the appointment and liability, or report there is no appointment."""
+    if not summary.has_appointment:
+        return NO_APPOINTMENT_TEMPLATE.substitute()
+    return DISCLOSURE_TEMPLATE.substitute(_values(summary))
+
+
+def render_fund_check(summary):
+    """SOP Step 2: ask whether the full appointment amount is available."""
+    return FUND_CHECK_TEMPLATE.substitute(_values(summary))
+
+
+def render_bank_question():
+    """SOP Step 3: ask which bank holds the full funds."""
+    return BANK_QUESTION
+
+
+def render_bank_mismatch(bank, summary):
+    return BANK_MISMATCH_TEMPLATE.substitute(bank=bank, appointed_bank=summary.appointed_bank or "N/A")
+
+
+def render_last4_question(bank):
+    return LAST4_QUESTION_TEMPLATE.substitute(bank=bank)
+
+
+def render_last4_reprompt():
+    return LAST4_REPROMPT
+
+
+def render_insufficient_funds():
+    """SOP Step 2 rejection when the full appointment amount is not available."""
+    return INSUFFICIENT_FUNDS
+
+
+def render_declined():
+    return DECLINED
+
+
+def render_release_details(decision, summary):
+    """Appointment, liability and verification sections of a decided case, shared by the summary and the bank notice."""
+    return RELEASE_DETAILS_TEMPLATE.substitute(
+        _values(summary),
+        fund="YES" if decision.fund_available else "NO",
+        bank_confirmed=decision.bank_confirmed or "Not provided",
+        last4=decision.account_last4 or "Not provided",
+    )
+
+
+def render_decision_summary(decision, summary, nric, case_number):
+    """SOP Step 4: the mandatory summary, filled from the structured decision and the case summary."""
+    values = _values(summary)
+    next_steps = APPROVED_NEXT_STEPS_TEMPLATE if decision.approved else REJECTED_NEXT_STEPS_TEMPLATE
+    return DECISION_SUMMARY_TEMPLATE.substitute(
+        values,
+        decision=decision.decision,
+        reason=decision.reason or "See the case summary below.",
+        nric=nric,
+        case_number=case_number,
+        details=render_release_details(decision, summary),
+        next_steps=next_steps.substitute(values),
+    )
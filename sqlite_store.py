@@ -0,0 +1,249 @@
+"""SQLite-backed tax record store.
+
+Import the CSV once (or load the ledger extract straight into the same
+schema) and point the app at the database file:
+
+    python sqlite_store.py data/tax_records.csv data/tax_records.db
+
+Rows stay on disk; each lookup is a single indexed query on
+(NRIC, Case_Number), so a Streamlit process never holds the full ledger.
+Per-case summaries live in a ``case_summaries`` table that an insert
+trigger keeps current when ledger rows are appended.
+"""
+import argparse
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from case_summary import CaseSummary
+
+TABLE = "tax_records"
+COLUMNS = [
+    "NRIC",
+    "Case_Number",
+    "Date",
+    "Description",
+    "Year_of_Assessment",
+    "Payable",
+    "Paid",
+    "Balance",
+    "Bank_Appointment_Date",
+    "Appointed_Bank",
+    "Appointment_Amount",
+]
+COLUMN_TYPES = {
+    "Year_of_Assessment": "INTEGER",
+    "Payable": "REAL",
+    "Paid": "REAL",
+    "Balance": "REAL",
+    "Appointment_Amount": "REAL",
+}
+
+# Fixed SQL text, so sqlite3's per-connection statement cache reuses the
+# prepared statements instead of re-parsing them on every lookup
+SELECT_CASE_SQL = (
+    f"SELECT {', '.join(COLUMNS)} FROM {TABLE} "
+    "WHERE NRIC = ? AND Case_Number = ? ORDER BY rowid"
+)
+SELECT_SUMMARY_SQL = (
+    "SELECT NRIC, Case_Number, year_of_assessment, total_payable, total_paid, current_balance, "
+    "appointed_bank, appointment_amount, appointment_date "
+    "FROM case_summaries WHERE NRIC = ? AND Case_Number = ?"
+)
+EXISTS_CASE_SQL = "SELECT 1 FROM case_summaries WHERE NRIC = ? AND Case_Number = ?"
+# Served from the (NRIC, Case_Number) primary key
+EXISTS_NRIC_SQL = "SELECT 1 FROM case_summaries WHERE NRIC = ? LIMIT 1"
+COUNT_SQL = f"SELECT COALESCE(MAX(rowid), 0) FROM {TABLE}"
+CASE_KEYS_SQL = "SELECT NRIC, Case_Number FROM case_summaries"
+
+# Per-case summaries: totals over every row, the current balance from the last
+# row and the appointment from the last row with a Bank_Appointment_Date
+SUMMARY_SELECT_SQL = f"""
+    SELECT g.NRIC, g.Case_Number,
+           COALESCE(a.Year_of_Assessment, l.Year_of_Assessment),
+           g.total_payable, g.total_paid, l.Balance,
+           a.Appointed_Bank, a.Appointment_Amount, a.Bank_Appointment_Date
+    FROM (
+        SELECT NRIC, Case_Number,
+               TOTAL(Payable) AS total_payable,
+               TOTAL(Paid) AS total_paid,
+               MAX(rowid) AS last_row,
+               MAX(CASE WHEN Bank_Appointment_Date IS NOT NULL AND Bank_Appointment_Date != ''
+                        THEN rowid END) AS appointment_row
+        FROM {TABLE} {{where}}
+        GROUP BY NRIC, Case_Number
+    ) AS g
+    JOIN {TABLE} AS l ON l.rowid = g.last_row
+    LEFT JOIN {TABLE} AS a ON a.rowid = g.appointment_row
+"""
+CREATE_SUMMARY_SQL = """
+    CREATE TABLE case_summaries (
+        NRIC TEXT, Case_Number TEXT, year_of_assessment INTEGER,
+        total_payable REAL, total_paid REAL, current_balance REAL,
+        appointed_bank TEXT, appointment_amount REAL, appointment_date TEXT,
+        PRIMARY KEY (NRIC, Case_Number)
+    )
+"""
+# Keeps case_summaries current as ledger rows are appended after the import
+CREATE_SUMMARY_TRIGGER_SQL = f"""
+    CREATE TRIGGER {TABLE}_summary_after_insert AFTER INSERT ON {TABLE}
+    BEGIN
+        INSERT OR REPLACE INTO case_summaries
+        {SUMMARY_SELECT_SQL.format(where="WHERE NRIC = NEW.NRIC AND Case_Number = NEW.Case_Number")};
+    END
+"""
+
+
+def import_csv_to_sqlite(csv_path, db_path, chunksize=100_000):
+    """Load a tax records CSV into db_path, creating the table and case index."""
+    conn = sqlite3.connect(db_path)
+    try:
+        with conn:
+            column_defs = ", ".join(f"{name} {COLUMN_TYPES.get(name, 'TEXT')}" for name in COLUMNS)
+            conn.execute(f"DROP TABLE IF EXISTS {TABLE}")
+            conn.execute("DROP TABLE IF EXISTS case_summaries")
+            conn.execute(f"CREATE TABLE {TABLE} ({column_defs})")
+
+            insert_sql = f"INSERT INTO {TABLE} ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})"
+            rows = 0
+            for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+                chunk = chunk[COLUMNS].astype(object).where(chunk[COLUMNS].notna(), None)
+                conn.executemany(insert_sql, chunk.itertuples(index=False, name=None))
+                rows += len(chunk)
+
+            conn.execute(f"CREATE INDEX idx_{TABLE}_case ON {TABLE} (NRIC, Case_Number)")
+            conn.execute(CREATE_SUMMARY_SQL)
+            conn.execute(f"INSERT INTO case_summaries {SUMMARY_SELECT_SQL.format(where='')}")
+            conn.execute(CREATE_SUMMARY_TRIGGER_SQL)
+            conn.execute("ANALYZE")
+    finally:
+        conn.close()
+    return rows
+
+
+class SqliteRecordStore:
+    """Record store answering case lookups from a SQLite database.
+
+    Streamlit runs every script rerun on a new thread, so per-thread
+    connections would be reopened (with a cold statement cache) on almost
+    every turn and never closed. Instead, lookups borrow a read-only
+    connection from a small bounded pool for the duration of one query; at
+    most ``pool_size`` connections are ever open, and one is only ever used by
+    one thread at a time.
+    """
+
+    def __init__(self, path, cached_statements=128, pool_size=4):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        self.path = path
+        self.cached_statements = cached_statements
+        self.version = 1
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._signature = self._signature_now()
+
+    def refresh(self):
+        """Note changes to the database; returns True if it changed.
+
+        Queries always read the live database, so this only bumps ``version``
+        for callers that cache derived data. In WAL mode commits land in the
+        -wal file and reach the main file only at a checkpoint, so both are
+        compared.
+        """
+        try:
+            signature = self._signature_now()
+        except FileNotFoundError:
+            return False
+        if signature == self._signature:
+            return False
+        self._signature = signature
+        self.version += 1
+        return True
+
+    def get_records(self, nric, case_number):
+        """Return the ledger rows for a case in insertion order, or None if unknown."""
+        with self._connection() as conn:
+            rows = conn.execute(SELECT_CASE_SQL, (nric, case_number)).fetchall()
+        if not rows:
+            return None
+        return pd.DataFrame(rows, columns=COLUMNS)
+
+    def get_summary(self, nric, case_number):
+        """Return the case_summaries row for a case as a CaseSummary, or None."""
+        with self._connection() as conn:
+            row = conn.execute(SELECT_SUMMARY_SQL, (nric, case_number)).fetchone()
+        if row is None:
+            return None
+        return CaseSummary(*row)
+
+    def __contains__(self, key):
+        with self._connection() as conn:
+            return conn.execute(EXISTS_CASE_SQL, key).fetchone() is not None
+
+    def has_nric(self, nric):
+        """Whether any case is on file for nric."""
+        with self._connection() as conn:
+            return conn.execute(EXISTS_NRIC_SQL, (nric,)).fetchone() is not None
+
+    def case_keys(self):
+        """All (NRIC, Case_Number) keys."""
+        with self._connection() as conn:
+            return conn.execute(CASE_KEYS_SQL).fetchall()
+
+    def __len__(self):
+        with self._connection() as conn:
+            return conn.execute(COUNT_SQL).fetchone()[0]
+
+    def close(self):
+        """Close the idle connections; connections in use are returned to the pool as usual."""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    @contextmanager
+    def _connection(self):
+        """Borrow a pooled connection, opening one if none is idle; blocks while pool_size are in use."""
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = sqlite3.connect(
+                    f"file:{self.path}?mode=ro",
+                    uri=True,
+                    cached_statements=self.cached_statements,
+                    check_same_thread=False,
+                )
+            try:
+                yield conn
+            finally:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def _signature_now(self):
+        try:
+            wal = self._file_signature(os.stat(f"{self.path}-wal"))
+        except FileNotFoundError:
+            wal = None
+        return self._file_signature(os.stat(self.path)), wal
+
+    @staticmethod
+    def _file_signature(stat):
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import the tax records CSV into a SQLite database.")
+    parser.add_argument("csv_path", nargs="?", default="data/tax_records.csv")
+    parser.add_argument("db_path", nargs="?", default="data/tax_records.db")
+    args = parser.parse_args()
+
+    count = import_csv_to_sqlite(args.csv_path, args.db_path)
+    print(f"Imported {count} rows into {args.db_path}")
@@ -0,0 +1,238 @@
+"""Deterministic stand-in for the chat completions API.
+
+``StubLLM`` answers without a network or a model: a decision turn gets the
+outcome the state machine expects (as a ``record_release_decision`` tool call
+when tools are offered, else as the SOP summary text), anything else gets a
+fixed scripted reply (or the first matching rule from a JSON script). It is
+used in-process with ``LLM_BACKEND=stub``, or over HTTP as a local
+OpenAI-compatible server for load tests and CI:
+
+    python stub_llm.py --port 8001
+    LLM_BACKEND=openai-compatible LLM_BASE_URL=http://127.0.0.1:8001/v1 streamlit run app.py
+
+A script file is a JSON list of {"match": "<regex>", "reply": "<text>"}
+rules, tried in order against the latest user message.
+"""
+import argparse
+import json
+import re
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+from openai.types.completion_usage import CompletionUsage
+
+from conversation_context import count_message_tokens, count_tokens
+
+DEFAULT_REPLY = ("Thank you for your question. I can help with Individual Income Tax (IIT) matters. "
+                 "For bank appointment releases, please provide your NRIC and Case Number.")
+
+DECISION_PATTERN = re.compile(r"expected outcome is (APPROVED|REJECTED)")
+FACT_PATTERNS = {
+    "fund": re.compile(r"Fund availability confirmed: (\w+)"),
+    "bank": re.compile(r"Bank account confirmed: (.*?) \(appointed bank: (.*?)\)"),
+    "last4": re.compile(r"Account last 4 digits: (.+)"),
+}
+
+
+def load_script(path):
+    with open(path, encoding="utf-8") as f:
+        return [(re.compile(rule["match"], re.IGNORECASE), rule["reply"]) for rule in json.load(f)]
+
+
+def decision_facts(instruction):
+    facts = {name: pattern.search(instruction) for name, pattern in FACT_PATTERNS.items()}
+    fund = facts["fund"].group(1) if facts["fund"] else "NO"
+    confirmed, appointed = facts["bank"].groups() if facts["bank"] else ("Not provided", "N/A")
+    last4 = facts["last4"].group(1).strip() if facts["last4"] else "Not provided"
+    return fund, confirmed, appointed, last4
+
+
+def decision_arguments(outcome, instruction):
+    """Arguments of the record_release_decision tool call for the expected outcome."""
+    fund, confirmed, _, last4 = decision_facts(instruction)
+    reason = ("The full appointment amount is available in the appointed bank account." if outcome == "APPROVED"
+              else "The release conditions were not met.")
+    return {
+        "decision": outcome,
+        "reason": reason,
+        "fund_available": fund == "YES",
+        "bank_confirmed": confirmed,
+        "account_last4": last4 if last4.isdigit() else "",
+    }
+
+
+def decision_summary(outcome, instruction):
+    fund, confirmed, appointed, last4 = decision_facts(instruction)
+
+    if outcome == "APPROVED":
+        reason = "The full appointment amount is available in the appointed bank account."
+        closing = (f"IRAS will send an official notification to {appointed} "
+                   "to release the bank appointment. You will be notified once the process is complete.")
+    else:
+        reason = "The release conditions were not met."
+        closing = "Please ensure the full appointment amount is available in the appointed bank account before trying again."
+
+    return f"""Thank you for your cooperation.
+Your request for bank appointment release is {outcome}
+REASON: {reason}
+
+BANK APPOINTMENT INFORMATION:
+- Appointed Bank: {appointed}
+
+FUND AVAILABILITY:
+- User confirmed: {fund}
+
+VERIFICATION:
+- Bank Account Confirmed: {confirmed}
+- Account Details: {last4}
+
+{closing}"""
+
+
+class StubLLM:
+    """Scripted chat completions with the same create() interface as LLMGateway."""
+
+    def __init__(self, rules=(), latency=0.0, model="stub"):
+        self.rules = list(rules)
+        self.latency = latency
+        self.model = model
+
+    def reply_for(self, messages):
+        system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+        last_user = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        for pattern, reply in self.rules:
+            if pattern.search(last_user):
+                return reply
+        decision = DECISION_PATTERN.search(system)
+        if decision:
+            return decision_summary(decision.group(1), system)
+        return DEFAULT_REPLY
+
+    def create(self, deadline=None, model=None, messages=(), stream=False, tools=None, **kwargs):
+        model = model or self.model
+        if tools:
+            system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+            decision = DECISION_PATTERN.search(system)
+            if decision:
+                return self._tool_call(model, messages, tools[0]["function"]["name"],
+                                       decision_arguments(decision.group(1), system))
+        content = self.reply_for(messages)
+        usage = CompletionUsage(
+            prompt_tokens=count_message_tokens(messages, model),
+            completion_tokens=count_tokens(content, model),
+            total_tokens=0,
+        )
+        usage.total_tokens = usage.prompt_tokens + usage.completion_tokens
+        if self.latency:
+            time.sleep(self.latency)
+        if stream:
+            include_usage = (kwargs.get("stream_options") or {}).get("include_usage", False)
+            return self._chunks(model, content, usage if include_usage else None)
+        return ChatCompletion(
+            id=f"chatcmpl-stub-{uuid.uuid4().hex[:12]}",
+            object="chat.completion",
+            created=int(time.time()),
+            model=model,
+            choices=[{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            usage=usage,
+        )
+
+    def _tool_call(self, model, messages, name, arguments):
+        arguments = json.dumps(arguments)
+        prompt_tokens = count_message_tokens(messages, model)
+        completion_tokens = count_tokens(arguments, model)
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatCompletion(
+            id=f"chatcmpl-stub-{uuid.uuid4().hex[:12]}",
+            object="chat.completion",
+            created=int(time.time()),
+            model=model,
+            choices=[{
+                "index": 0,
+                "finish_reason": "tool_calls",
+                "message": {
+                    "role": "assistant",
+                    "content": None,
+                    "tool_calls": [{
+                        "id": f"call_{uuid.uuid4().hex[:12]}",
+                        "type": "function",
+                        "function": {"name": name, "arguments": arguments},
+                    }],
+                },
+            }],
+            usage=CompletionUsage(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                  total_tokens=prompt_tokens + completion_tokens),
+        )
+
+    def _chunks(self, model, content, usage):
+        completion_id = f"chatcmpl-stub-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        def chunk(choices, usage=None):
+            return ChatCompletionChunk(id=completion_id, object="chat.completion.chunk", created=created,
+                                       model=model, choices=choices, usage=usage)
+
+        # Word-sized deltas, like a real stream
+        for piece in re.findall(r"\S+\s*|\s+", content):
+            yield chunk([{"index": 0, "delta": {"role": "assistant", "content": piece}, "finish_reason": None}])
+        yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+        if usage is not None:
+            yield chunk([], usage)
+
+
+def make_handler(stub):
+    class StubCompletionsHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self.send_error(404)
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            result = stub.create(**request)
+
+            if not request.get("stream"):
+                body = result.model_dump_json(exclude_none=True).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for chunk in result:
+                self.wfile.write(f"data: {chunk.model_dump_json(exclude_none=True)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.close_connection = True
+
+    return StubCompletionsHandler
+
+
+def serve(host="127.0.0.1", port=8001, stub=None):
+    server = ThreadingHTTPServer((host, port), make_handler(stub or StubLLM()))
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the scripted stub model as an OpenAI-compatible endpoint.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--script", help="JSON list of {match, reply} rules")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before each reply")
+    args = parser.parse_args()
+
+    stub = StubLLM(load_script(args.script) if args.script else (), latency=args.latency)
+    server = serve(args.host, args.port, stub)
+    print(f"Stub model serving http://{args.host}:{args.port}/v1/chat/completions")
+    server.serve_forever()
@@ -0,0 +1,292 @@
+"""Typed, memory-mapped columnar snapshot of the tax records CSV.
+
+Build a snapshot offline, next to the CSV:
+
+    python tax_snapshot.py data/tax_records.csv data/tax_records.snapshot
+
+A snapshot is a directory holding one ``.npy`` file per column plus a
+sorted key index and a ``manifest.json``; the snapshot path is a symlink to
+the current version of that directory. Opening it memory-maps the arrays
+read-only, so it takes milliseconds regardless of row count and every
+Streamlit worker process on the host shares the same physical pages.
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from case_summary import CaseSummary, summarize_cases
+
+MANIFEST = "manifest.json"
+DATE_FORMAT = "%d %b %Y"
+
+DATE_COLUMNS = ["Date", "Bank_Appointment_Date"]
+AMOUNT_COLUMNS = ["Payable", "Paid", "Balance", "Appointment_Amount"]
+CATEGORY_COLUMNS = ["Appointed_Bank"]
+TEXT_COLUMNS = ["Description"]
+KEY_SEPARATOR = "|"
+SUMMARY_FIELDS = ["total_payable", "total_paid", "current_balance", "year_of_assessment", "appointment_row"]
+
+
+def _case_key(nric, case_number):
+    return f"{nric}{KEY_SEPARATOR}{case_number}"
+
+
+def convert_csv_to_snapshot(csv_path, snapshot_path):
+    """Convert a tax records CSV into a snapshot directory at snapshot_path."""
+    df = pd.read_csv(csv_path, dtype={"NRIC": str, "Case_Number": str, "Description": str})
+
+    tmp_path = f"{snapshot_path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    columns = {}
+    categories = {}
+    for column in df.columns:
+        if column in ("NRIC", "Case_Number"):
+            continue
+        if column in DATE_COLUMNS:
+            # Kept as written ("2 Apr 2025" stays unpadded), so rows match the CSV and SQLite backends
+            values = df[column].fillna("").to_numpy(str)
+        elif column in AMOUNT_COLUMNS:
+            values = pd.to_numeric(df[column], errors="coerce").to_numpy("float64")
+        elif column in CATEGORY_COLUMNS:
+            codes, uniques = pd.factorize(df[column])
+            values = codes.astype("int16")
+            categories[column] = [str(u) for u in uniques]
+        elif column in TEXT_COLUMNS:
+            values = df[column].fillna("").to_numpy(str)
+        else:
+            series = pd.to_numeric(df[column], errors="coerce")
+            values = series.to_numpy("int32") if series.notna().all() else series.to_numpy("float64")
+        np.save(os.path.join(tmp_path, f"{column}.npy"), values)
+        columns[column] = str(values.dtype)
+
+    # Key index: unique case keys in sorted order, with each key's rows kept
+    # contiguous (and in file order) inside row_order
+    keys = np.char.add(np.char.add(df["NRIC"].to_numpy(str), KEY_SEPARATOR), df["Case_Number"].to_numpy(str))
+    row_order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[row_order]
+    unique_keys, key_starts = np.unique(sorted_keys, return_index=True)
+    key_starts = np.append(key_starts, len(sorted_keys)).astype("int64")
+
+    np.save(os.path.join(tmp_path, "keys.npy"), unique_keys)
+    np.save(os.path.join(tmp_path, "key_starts.npy"), key_starts)
+    np.save(os.path.join(tmp_path, "row_order.npy"), row_order.astype("int64"))
+
+    # Per-case summaries, aligned with keys.npy
+    summary = summarize_cases(df)
+    summary_keys = np.char.add(
+        np.char.add(summary.index.get_level_values("NRIC").to_numpy(str), KEY_SEPARATOR),
+        summary.index.get_level_values("Case_Number").to_numpy(str),
+    )
+    summary = summary.iloc[np.argsort(summary_keys, kind="stable")]
+    for field in SUMMARY_FIELDS:
+        dtype = "int64" if field == "appointment_row" else "float64"
+        np.save(os.path.join(tmp_path, f"summary_{field}.npy"), summary[field].to_numpy(dtype))
+
+    manifest = {
+        "columns": list(df.columns),
+        "dtypes": columns,
+        "categories": categories,
+        "rows": len(df),
+        "cases": len(unique_keys),
+    }
+    with open(os.path.join(tmp_path, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    _publish(tmp_path, snapshot_path)
+    return manifest
+
+
+def _publish(tmp_path, snapshot_path):
+    """Make a finished snapshot directory current.
+
+    snapshot_path is a symlink to a versioned directory next to it, and a new
+    version is published by atomically replacing the symlink, so a reader
+    opening the snapshot always finds a complete one. The previous version is
+    kept for readers that resolved the link just before the swap; older ones
+    are removed (readers holding their mmaps keep the unlinked files).
+    """
+    version_path = f"{snapshot_path}.v{time.time_ns()}"
+    os.replace(tmp_path, version_path)
+
+    previous = None
+    if os.path.islink(snapshot_path):
+        previous = os.path.realpath(snapshot_path)
+    elif os.path.isdir(snapshot_path):
+        # A snapshot written before versioned directories: move it aside once
+        previous = f"{snapshot_path}.v0"
+        os.replace(snapshot_path, previous)
+
+    link_path = f"{snapshot_path}.link-{os.getpid()}"
+    os.symlink(os.path.basename(version_path), link_path)
+    os.replace(link_path, snapshot_path)
+
+    keep = {os.path.realpath(version_path), previous and os.path.realpath(previous)}
+    for path in glob.glob(f"{glob.escape(snapshot_path)}.v*"):
+        if os.path.realpath(path) not in keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def _date_strings(values):
+    """Date column values as object strings, with NaN for missing dates."""
+    if values.dtype.kind == "M":
+        # Snapshots written before dates were kept as strings
+        return pd.Series(values).dt.strftime(DATE_FORMAT).to_numpy(object)
+    strings = values.astype(object)
+    strings[values == ""] = np.nan
+    return strings
+
+
+class TaxSnapshot:
+    """Read-only record store over a memory-mapped snapshot directory.
+
+    Exposes the same lookup interface as ``record_store.TaxRecordStore``;
+    only the rows of the requested case are materialised into a DataFrame,
+    with dates as the CSV's original strings and missing ones as NaN.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.version = 0
+        self._lock = threading.Lock()
+        self._signature = None
+        self.load()
+
+    def load(self):
+        # Resolve the symlink once, so every file comes from the same version
+        version_path = os.path.realpath(self.path)
+        manifest_path = os.path.join(version_path, MANIFEST)
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+        arrays = {
+            column: np.load(os.path.join(version_path, f"{column}.npy"), mmap_mode="r")
+            for column in manifest["dtypes"]
+        }
+        index = {
+            name: np.load(os.path.join(version_path, f"{name}.npy"), mmap_mode="r")
+            for name in ("keys", "key_starts", "row_order")
+        }
+        summaries = {
+            field: np.load(os.path.join(version_path, f"summary_{field}.npy"), mmap_mode="r")
+            for field in SUMMARY_FIELDS
+        }
+
+        with self._lock:
+            self._manifest = manifest
+            self._arrays = arrays
+            self._keys = index["keys"]
+            self._key_starts = index["key_starts"]
+            self._row_order = index["row_order"]
+            self._summaries = summaries
+            self._signature = self._file_signature(os.stat(manifest_path))
+            self.version += 1
+
+    def refresh(self):
+        """Reopen the snapshot if it was rebuilt; returns True if it changed."""
+        try:
+            stat = os.stat(os.path.join(self.path, MANIFEST))
+        except FileNotFoundError:
+            return False
+        if self._file_signature(stat) == self._signature:
+            return False
+        self.load()
+        return True
+
+    def get_records(self, nric, case_number):
+        """Return the ledger rows for a case in file order, or None if unknown."""
+        with self._lock:
+            i = self._key_position(_case_key(nric, case_number))
+            if i is None:
+                return None
+            positions = np.asarray(self._row_order[self._key_starts[i]:self._key_starts[i + 1]])
+
+            data = {"NRIC": nric, "Case_Number": case_number}
+            for column in self._manifest["columns"]:
+                if column in data:
+                    continue
+                values = np.asarray(self._arrays[column][positions])
+                if column in DATE_COLUMNS:
+                    data[column] = _date_strings(values)
+                elif column in CATEGORY_COLUMNS:
+                    categories = self._manifest["categories"][column]
+                    data[column] = [categories[code] if code >= 0 else np.nan for code in values]
+                else:
+                    data[column] = values
+            return pd.DataFrame(data, index=positions, columns=self._manifest["columns"])
+
+    def get_summary(self, nric, case_number):
+        """Return the precomputed CaseSummary for a case, or None if unknown."""
+        with self._lock:
+            i = self._key_position(_case_key(nric, case_number))
+            if i is None:
+                return None
+
+            fields = {field: self._summaries[field][i].item() for field in SUMMARY_FIELDS}
+            row = fields.pop("appointment_row")
+            year = fields.pop("year_of_assessment")
+            appointment = {}
+            if row >= 0:
+                code = self._arrays["Appointed_Bank"][row]
+                amount = self._arrays["Appointment_Amount"][row].item()
+                date = _date_strings(self._arrays["Bank_Appointment_Date"][row:row + 1])[0]
+                appointment = {
+                    "appointed_bank": self._manifest["categories"]["Appointed_Bank"][code] if code >= 0 else None,
+                    "appointment_amount": None if np.isnan(amount) else amount,
+                    "appointment_date": date if isinstance(date, str) else None,
+                }
+            return CaseSummary(
+                nric=nric,
+                case_number=case_number,
+                year_of_assessment=None if np.isnan(year) else int(year),
+                **fields,
+                **appointment,
+            )
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._key_position(_case_key(*key)) is not None
+
+    def has_nric(self, nric):
+        """Whether any case is on file for nric; its keys sort together, so one binary search."""
+        prefix = f"{nric}{KEY_SEPARATOR}"
+        with self._lock:
+            i = int(np.searchsorted(self._keys, prefix))
+            return i < len(self._keys) and str(self._keys[i]).startswith(prefix)
+
+    def case_keys(self):
+        """All (NRIC, Case_Number) keys."""
+        with self._lock:
+            keys = self._keys
+        return [tuple(key.split(KEY_SEPARATOR, 1)) for key in keys.tolist()]
+
+    def __len__(self):
+        return self._manifest["rows"]
+
+    def _key_position(self, key):
+        i = int(np.searchsorted(self._keys, key))
+        if i >= len(self._keys) or self._keys[i] != key:
+            return None
+        return i
+
+    @staticmethod
+    def _file_signature(stat):
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the tax records CSV into a memory-mapped snapshot.")
+    parser.add_argument("csv_path", nargs="?", default="data/tax_records.csv")
+    parser.add_argument("snapshot_path", nargs="?", default="data/tax_records.snapshot")
+    args = parser.parse_args()
+
+    result = convert_csv_to_snapshot(args.csv_path, args.snapshot_path)
+    print(f"Wrote {result['rows']} rows ({result['cases']} cases) to {args.snapshot_path}")
@@ -0,0 +1,237 @@
+"""Stage timings, metrics and leveled logging.
+
+Every chat turn passes through the same stages: input scan, record load,
+prompt build, the model call, and in the background the SMTP send; every
+rerun renders the portal. ``span(stage)`` times a stage into the
+``taxbuddy_stage_seconds`` histogram and, at DEBUG level, writes one log line
+per span with its duration and fields. Model token usage goes to
+``taxbuddy_llm_tokens_total``.
+
+Metrics are kept in-process and exposed in the Prometheus text format by
+``start_metrics_server`` (``GET /metrics``), so there is no client library to
+install. Log lines are plain text or one JSON object per line.
+
+Debug logging costs nothing when disabled: callers pass lazy ``%s``
+arguments, and spans only build their log record when DEBUG is enabled.
+With ``set_metrics_enabled(False)`` spans do not read the clock either.
+"""
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LOGGER_NAME = "taxbuddy"
+LOG_FORMATS = ("text", "json")
+
+# Upper bounds in seconds: sub-millisecond scans up to multi-second model calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def get_logger(area):
+    return logging.getLogger(f"{LOGGER_NAME}.{area}")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message and any extra fields."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update((k, v) for k, v in vars(record).items() if k not in _RECORD_ATTRS)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level="WARNING", log_format="text"):
+    """Attach one handler to the ``taxbuddy`` logger; safe to call on every script rerun."""
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format {log_format!r}; expected one of {', '.join(LOG_FORMATS)}")
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+    handler = next((h for h in logger.handlers if getattr(h, "_taxbuddy", False)), None)
+    if handler is None:
+        handler = logging.StreamHandler()
+        handler._taxbuddy = True
+        logger.addHandler(handler)
+    handler.setFormatter(JsonFormatter() if log_format == "json" else
+                         logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    return logger
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, dict(key), value) for key, value in self._values.items()]
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), sum, count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def samples(self):
+        with self._lock:
+            series = [(dict(key), list(counts), total, count) for key, (counts, total, count) in self._series.items()]
+        samples = []
+        for labels, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                samples.append((f"{self.name}_bucket", dict(labels, le=le), cumulative))
+            samples.append((f"{self.name}_sum", labels, total))
+            samples.append((f"{self.name}_count", labels, count))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name, help_text):
+        return self._get(Counter, name, help_text)
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            kind = "counter" if isinstance(metric, Counter) else "histogram"
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.histogram("taxbuddy_stage_seconds", "Time spent in each request stage.")
+STAGE_ERRORS = REGISTRY.counter("taxbuddy_stage_errors_total", "Stages that ended with an exception.")
+LLM_TOKENS = REGISTRY.counter("taxbuddy_llm_tokens_total", "Model tokens used, by model and kind (prompt/completion).")
+
+_span_logger = get_logger("span")
+_metrics_enabled = True
+
+
+def set_metrics_enabled(enabled):
+    global _metrics_enabled
+    _metrics_enabled = bool(enabled)
+
+
+@contextmanager
+def span(stage, **fields):
+    """Time a stage into ``taxbuddy_stage_seconds``; fields become log fields, not metric labels."""
+    if not _metrics_enabled and not _span_logger.isEnabledFor(logging.DEBUG):
+        yield
+        return
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        if _metrics_enabled:
+            STAGE_SECONDS.observe(elapsed, stage=stage)
+            if error is not None:
+                STAGE_ERRORS.inc(stage=stage)
+        if _span_logger.isEnabledFor(logging.DEBUG):
+            extra = dict(fields, stage=stage, duration_ms=round(elapsed * 1000, 3))
+            if error is not None:
+                extra["error"] = type(error).__name__
+            _span_logger.debug("%s took %.1f ms", stage, elapsed * 1000, extra=extra)
+
+
+def record_token_usage(model, usage):
+    """Count a completion's prompt and completion tokens; usage may be None (e.g. a stream without usage)."""
+    if usage is None or not _metrics_enabled:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, model=model, kind="prompt")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, model=model, kind="completion")
+
+
+def render_prometheus():
+    return REGISTRY.render()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        get_logger("metrics").debug(format, *args)
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve ``/metrics`` from a daemon thread; returns the server (``server_address`` has the bound port)."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setenv("LLM_BACKEND", "stub")
+    monkeypatch.setenv("LLM_MODEL", "test-model")
+    monkeypatch.delenv("LLM_FAST_MODEL", raising=False)
+    monkeypatch.setenv("BANK_EMAILS", "DBS:dbs@example.com,UOB:uob@example.com")
+    monkeypatch.setenv("EMAIL_OUTBOX_PATH", str(tmp_path / "outbox.db"))
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=60)
+    at.session_state["password_correct"] = True
+    at.run()
+    return at
+
+
+def send(at, message):
+    at.text_input[0].input(message)
+    next(b for b in at.button if b.label == "▶").click()
+    at.run()
+    assert not at.exception
+
+
+def test_case_number_before_nric_is_kept(app):
+    send(app, "My case number is TX002")
+    assert app.session_state["case_number"] == "TX002"
+
+    send(app, "My NRIC is S2222222B")
+    assert (app.session_state["nric"], app.session_state["case_number"]) == ("S2222222B", "TX002")
+    assert app.session_state["sop_state"].is_case("S2222222B", "TX002")
+
+
+def test_new_nric_drops_the_previous_case_number(app):
+    send(app, "NRIC S2222222B case TX002")
+    send(app, "Actually my NRIC is S3333333C")
+    assert (app.session_state["nric"], app.session_state["case_number"]) == ("S3333333C", "")
+
+
+def test_sidebar_shows_the_configured_model(app):
+    sidebar = [m.value for m in app.sidebar.markdown]
+    assert "**Model:** test-model" in sidebar
+    assert "**Backend:** stub" in sidebar
@@ -0,0 +1,17 @@
+from bank_notifications import build_digest_email, to_mime
+
+# RFC 5321 line limit, excluding CRLF
+SMTP_MAX_LINE = 998
+
+
+def test_digest_lines_fit_smtp_limit():
+    emails = [{
+        "reference": f"IRAS-BankAppt-TX{i:03d}",
+        "sender": "iras@example.com",
+        "recipient": "dbs@example.com",
+        "bank": "DBS",
+        "subject": "Release",
+        "body": "Notice body",
+    } for i in range(200)]
+    message = to_mime(build_digest_email(emails)).as_string()
+    assert max(len(line) for line in message.splitlines()) <= SMTP_MAX_LINE
@@ -0,0 +1,64 @@
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from record_store import open_record_store
+from sqlite_store import SqliteRecordStore, import_csv_to_sqlite
+from tax_snapshot import convert_csv_to_snapshot
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "tax_records.csv")
+
+
+@pytest.fixture(scope="module")
+def stores(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("stores")
+    convert_csv_to_snapshot(CSV_PATH, str(tmp / "tax_records.snapshot"))
+    import_csv_to_sqlite(CSV_PATH, str(tmp / "tax_records.db"))
+    stores = {
+        "csv": open_record_store(CSV_PATH, "csv"),
+        "snapshot": open_record_store(str(tmp / "tax_records.snapshot"), "snapshot"),
+        "sqlite": open_record_store(str(tmp / "tax_records.db"), "sqlite"),
+    }
+    yield stores
+    stores["sqlite"].close()
+
+
+def rows(records):
+    return records.astype(object).where(records.notna(), None).values.tolist()
+
+
+@pytest.mark.parametrize("backend", ["snapshot", "sqlite"])
+def test_backends_return_the_csv_rows(stores, backend):
+    csv = stores["csv"]
+    for key in csv.case_keys():
+        assert rows(stores[backend].get_records(*key)) == rows(csv.get_records(*key))
+        assert stores[backend].get_summary(*key) == csv.get_summary(*key)
+
+
+def test_snapshot_keeps_dates_as_written(stores):
+    # Row 9 of the sample is "2 Apr 2025", not zero-padded
+    assert stores["snapshot"].get_records("S4444444D", "TX004")["Date"].tolist() == ["29 Mar 2025", "2 Apr 2025"]
+    assert pd.isna(stores["snapshot"].get_records("S2222222B", "TX002")["Bank_Appointment_Date"].iloc[0])
+
+
+def test_sqlite_refresh_sees_wal_commits(tmp_path):
+    db_path = str(tmp_path / "tax_records.db")
+    import_csv_to_sqlite(CSV_PATH, db_path)
+    writer = sqlite3.connect(db_path)
+    writer.execute("PRAGMA journal_mode=WAL")
+    # Keep commits in the -wal file
+    writer.execute("PRAGMA wal_autocheckpoint=0")
+    store = SqliteRecordStore(db_path)
+    try:
+        main_before = os.stat(db_path).st_mtime_ns
+        with writer:
+            writer.execute("INSERT INTO tax_records (NRIC, Case_Number, Date) VALUES ('S5555555E', 'TX005', '1 Jun 2025')")
+        assert os.stat(db_path).st_mtime_ns == main_before
+        assert store.refresh()
+        assert ("S5555555E", "TX005") in store
+        assert not store.refresh()
+    finally:
+        store.close()
+        writer.close()
@@ -0,0 +1,49 @@
+import pytest
+
+from sop_flow import parse_yes_no
+
+
+@pytest.mark.parametrize("reply", [
+    "yes",
+    "Yes, I have the full amount",
+    "yep",
+    "Correct",
+    "Yes I do",
+])
+def test_plain_yes(reply):
+    assert parse_yes_no(reply) is True
+
+
+@pytest.mark.parametrize("reply", [
+    "no",
+    "Nope",
+    "I don't have enough",
+    "I do not have the full amount",
+    "No, the funds are insufficient",
+])
+def test_plain_no(reply):
+    assert parse_yes_no(reply) is False
+
+
+@pytest.mark.parametrize("reply", [
+    # Weak acknowledgements followed by a qualification
+    "OK, but I do not have the full amount",
+    "Sure, but not the full amount",
+    "Yes, but not all of it",
+    # A partial amount is not the full amount
+    "I have only 500 dollars",
+    # Idioms whose negative word is not an answer
+    "No problem, I have it",
+    "Not sure",
+    # Mixed polarity
+    "Yes there is enough, no issue",
+    "yes I do, no problem",
+    "Yes, I'm not worried",
+    # Acknowledgements alone and questions
+    "ok",
+    "sure",
+    "What if I only have part of it?",
+    "",
+])
+def test_unclear_replies_ask_again(reply):
+    assert parse_yes_no(reply) is None